@@ -0,0 +1,110 @@
+import os
+import re
+import time
+from collections import OrderedDict
+from threading import Lock
+
+import numpy as np
+
+# A cached answer is reused when a new query is at least this cosine-similar to it
+SIMILARITY_THRESHOLD = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
+TTL_SECONDS = int(os.getenv("ANSWER_CACHE_TTL_SECONDS", str(6 * 60 * 60)))
+MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1024"))
+
+# Words that usually point back at an earlier turn ("what about its complexity?")
+_FOLLOW_UP_WORDS = {
+    "it", "its", "this", "that", "these", "those", "they", "them", "their",
+    "he", "she", "him", "her", "above", "previous", "earlier", "again",
+    "same", "more", "else", "also", "another", "other",
+}
+_FOLLOW_UP_PREFIXES = ("and ", "but ", "so ", "what about", "how about", "why not", "then ")
+
+_entries = OrderedDict()  # entry id -> {"scope", "vector", "answer", "created"}
+_next_id = 0
+_lock = Lock()
+
+_stats = {
+    "hits": 0,
+    "misses": 0,
+    "skipped_follow_up": 0,
+    "expired": 0,
+    "evicted": 0,
+}
+
+
+def depends_on_history(query, memory):
+    # With no prior turns the question can only mean one thing
+    if not memory:
+        return False
+    text = query.strip().lower()
+    if text.startswith(_FOLLOW_UP_PREFIXES):
+        return True
+    words = re.findall(r"[a-z']+", text)
+    if len(words) <= 3:
+        return True
+    return any(word in _FOLLOW_UP_WORDS for word in words)
+
+
+def _normalize(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def _prune(now):
+    # Entries are in insertion/LRU order, but TTL is checked on all of them since hits refresh order
+    expired = [key for key, entry in _entries.items() if now - entry["created"] > TTL_SECONDS]
+    for key in expired:
+        del _entries[key]
+    _stats["expired"] += len(expired)
+
+
+def lookup(scope, query_vector):
+    query_vector = _normalize(query_vector)
+    now = time.time()
+    with _lock:
+        _prune(now)
+        candidates = [(key, entry) for key, entry in _entries.items() if entry["scope"] == scope]
+        if candidates:
+            matrix = np.stack([entry["vector"] for _key, entry in candidates])
+            similarities = matrix @ query_vector
+            best = int(np.argmax(similarities))
+            if similarities[best] >= SIMILARITY_THRESHOLD:
+                key, entry = candidates[best]
+                _entries.move_to_end(key)
+                _stats["hits"] += 1
+                return entry["answer"]
+        _stats["misses"] += 1
+        return None
+
+
+def store(scope, query_vector, answer):
+    global _next_id
+    with _lock:
+        _entries[_next_id] = {
+            "scope": scope,
+            "vector": _normalize(query_vector),
+            "answer": answer,
+            "created": time.time(),
+        }
+        _next_id += 1
+        while len(_entries) > MAX_ENTRIES:
+            _entries.popitem(last=False)
+            _stats["evicted"] += 1
+
+
+def record_skip():
+    with _lock:
+        _stats["skipped_follow_up"] += 1
+
+
+def answer_cache_stats():
+    with _lock:
+        stats = dict(_stats)
+        stats["entries"] = len(_entries)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else None
+    stats["similarity_threshold"] = SIMILARITY_THRESHOLD
+    stats["ttl_seconds"] = TTL_SECONDS
+    stats["max_entries"] = MAX_ENTRIES
+    return stats
@@ -0,0 +1,66 @@
+# Compare query-encoding throughput of the micro-batching dispatcher against
+# encoding each query on its own, with many concurrent "students".
+#
+#   python universe/flask/benchmarks/bench_embedding_batching.py --clients 32 --queries 20
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from embeddings import EmbeddingBatcher, _encode_batch, warm_up_embeddings  # noqa: E402
+
+QUERIES = [
+    "What is the difference between a process and a thread?",
+    "Explain Kirchhoff's current law",
+    "Define eigenvalue and eigenvector",
+    "What does CS301 cover in module 3?",
+    "How does TCP congestion control work?",
+    "State the first law of thermodynamics",
+]
+
+
+def run(encode_one, clients, per_client):
+    def worker(i):
+        for j in range(per_client):
+            encode_one(QUERIES[(i + j) % len(QUERIES)])
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        list(pool.map(worker, range(clients)))
+    elapsed = time.perf_counter() - start
+    return clients * per_client / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--queries", type=int, default=20, help="queries per client")
+    parser.add_argument("--window-ms", type=float, default=5)
+    parser.add_argument("--max-batch", type=int, default=32)
+    args = parser.parse_args()
+
+    warm_up_embeddings()
+
+    # Baseline: every request encodes its single query under the model lock
+    single_lock = Lock()
+
+    def encode_single(text):
+        with single_lock:
+            return _encode_batch([text])[0]
+
+    baseline = run(encode_single, args.clients, args.queries)
+
+    batcher = EmbeddingBatcher(window_ms=args.window_ms, max_batch_size=args.max_batch)
+    batched = run(batcher.embed, args.clients, args.queries)
+
+    print(f"clients={args.clients} queries/client={args.queries} window={args.window_ms}ms max_batch={args.max_batch}")
+    print(f"one-at-a-time: {baseline:8.1f} queries/s")
+    print(f"micro-batched: {batched:8.1f} queries/s  ({batched / baseline:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
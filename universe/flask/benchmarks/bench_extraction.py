@@ -0,0 +1,75 @@
+# Throughput of document extraction: one file at a time vs the extraction process pool.
+# Builds a fixture corpus of .docx and .pptx files (or uses --corpus DIR of real uploads).
+#
+#   python universe/flask/benchmarks/bench_extraction.py --files 20 --paragraphs 3000
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from document_extraction import EXTRACT_WORKERS, SUPPORTED_EXTENSIONS, extract_documents, extract_text  # noqa: E402
+
+SENTENCE = "The quick brown fox studies eigenvalues, TCP congestion control and the Krebs cycle. "
+
+
+def build_corpus(directory, files, paragraphs):
+    from docx import Document as WordDocument
+    from pptx import Presentation
+    from pptx.util import Inches
+
+    for i in range(files):
+        if i % 4 == 3:
+            presentation = Presentation()
+            for slide_no in range(paragraphs // 20):
+                slide = presentation.slides.add_slide(presentation.slide_layouts[5])
+                box = slide.shapes.add_textbox(Inches(1), Inches(1), Inches(8), Inches(5))
+                box.text_frame.text = f"Slide {slide_no}. " + SENTENCE * 5
+            presentation.save(os.path.join(directory, f"deck_{i}.pptx"))
+        else:
+            doc = WordDocument()
+            for p in range(paragraphs):
+                doc.add_paragraph(f"{p}. " + SENTENCE * 3)
+            doc.save(os.path.join(directory, f"notes_{i}.docx"))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", help="directory of real uploads to use instead of generated fixtures")
+    parser.add_argument("--files", type=int, default=20)
+    parser.add_argument("--paragraphs", type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        directory = args.corpus or tmp
+        if not args.corpus:
+            build_corpus(directory, args.files, args.paragraphs)
+        paths = [os.path.join(directory, f) for f in sorted(os.listdir(directory)) if f.endswith(SUPPORTED_EXTENSIONS)]
+        size_mb = sum(os.path.getsize(p) for p in paths) / 1e6
+
+        start = time.perf_counter()
+        sequential_chars = sum(len(extract_text(p)) for p in paths)
+        sequential = time.perf_counter() - start
+
+        # Warm the pool so worker start-up is not billed to the first batch
+        list(extract_documents(paths[:1]))
+        start = time.perf_counter()
+        pooled_chars = 0
+        failures = 0
+        for _path, pages, error in extract_documents(paths):
+            if error:
+                failures += 1
+            else:
+                pooled_chars += sum(len(text) for _page, text in pages)
+        pooled = time.perf_counter() - start
+
+    print(f"{len(paths)} files, {size_mb:.1f} MB, {EXTRACT_WORKERS} workers")
+    print(f"sequential: {sequential:6.2f}s  {len(paths) / sequential:6.1f} files/s  ({sequential_chars} chars)")
+    print(f"pooled:     {pooled:6.2f}s  {len(paths) / pooled:6.1f} files/s  ({pooled_chars} chars, {failures} failed)")
+    print(f"speed-up:   {sequential / pooled:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+# Latency and recall of vector-only vs hybrid (vector + BM25, RRF-fused) retrieval
+# over an existing AI Teacher collection.
+#
+#   python universe/flask/benchmarks/bench_hybrid_retrieval.py --owner alice --queries labelled.jsonl
+#
+# labelled.jsonl holds one {"query": "...", "source": "lecture3.pdf"} per line; a query counts as
+# recalled when a chunk from its expected source is among the top k results.
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from embeddings import warm_up_embeddings  # noqa: E402
+from query_data import _retrieve, _scoped_collections, _vector_search  # noqa: E402
+
+
+def measure(search, cases, k):
+    latencies = []
+    hits = 0
+    for case in cases:
+        start = time.perf_counter()
+        results = search(case["query"], k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        if any(doc.metadata.get("source") == case["source"] for doc, _score in results):
+            hits += 1
+    latencies.sort()
+    return {
+        "recall": hits / len(cases),
+        "p50_ms": statistics.median(latencies),
+        "p95_ms": latencies[int(0.95 * (len(latencies) - 1))],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--owner", required=True)
+    parser.add_argument("--queries", required=True)
+    parser.add_argument("--course", action="append", default=[])
+    parser.add_argument("--k", type=int, nargs="+", default=[3, 6, 10])
+    args = parser.parse_args()
+
+    with open(args.queries) as f:
+        cases = [json.loads(line) for line in f if line.strip()]
+    collections = _scoped_collections(args.owner, args.course)
+    warm_up_embeddings()
+
+    for k in args.k:
+        vector = measure(lambda q, k: _vector_search(q, k, collections), cases, k)
+        hybrid = measure(lambda q, k: _retrieve(q, k, collections), cases, k)
+        for name, result in (("vector", vector), ("hybrid", hybrid)):
+            print(f"k={k:<3} {name:<7} recall={result['recall']:.3f} p50={result['p50_ms']:.1f}ms p95={result['p95_ms']:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+# LLM round trips and throughput of quiz MCQ generation: one question per call vs batched calls.
+# Uses the deterministic fake LLM backend by default, so only call overhead differs between runs;
+# point LLM_BACKEND / LLM_BASE_URL at a real model to measure end to end.
+#
+#   FAKE_LLM_LATENCY_MS=400 python universe/flask/benchmarks/bench_mcq_generation.py --questions 20 --batch-size 5
+import argparse
+import os
+import random
+import sys
+import time
+
+os.environ.setdefault("LLM_BACKEND", "fake")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from quiz.quiz_query_data import generate_mcq_batch, mcq_stats  # noqa: E402
+
+VOCABULARY = (
+    "congestion window eigenvalue matrix mitochondria glucose photosynthesis algorithm shortest path "
+    "graph entropy enzyme protein lattice voltage current resistor capacitor orbital covalent ionic "
+    "recursion stack queue heap allele genome inflation demand supply equilibrium momentum torque"
+).split()
+
+
+def contexts(count):
+    # Distinct synthetic passages, reproducible across runs
+    rng = random.Random(42)
+    return [" ".join(rng.choice(VOCABULARY) for _ in range(60)) for _ in range(count)]
+
+
+def run(passages, batch_size):
+    before = mcq_stats()
+    start = time.perf_counter()
+    questions = []
+    for offset in range(0, len(passages), batch_size):
+        batch = passages[offset:offset + batch_size]
+        questions.extend(mcq for _index, mcq in generate_mcq_batch(batch, seen_questions=[q["question"] for q in questions]))
+    elapsed = time.perf_counter() - start
+    after = mcq_stats()
+    return {
+        "questions": len(questions),
+        "llm_calls": after["llm_calls"] - before["llm_calls"],
+        "malformed": after["malformed"] - before["malformed"],
+        "duplicates": after["duplicates"] - before["duplicates"],
+        "seconds": elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--questions", type=int, default=20)
+    parser.add_argument("--batch-size", type=int, default=5)
+    args = parser.parse_args()
+
+    passages = contexts(args.questions)
+    for label, batch_size in (("one per call", 1), (f"batches of {args.batch_size}", args.batch_size)):
+        result = run(passages, batch_size)
+        print(
+            f"{label:16s} {result['questions']:3d} questions in {result['llm_calls']:3d} calls, "
+            f"{result['seconds']:6.2f}s, {result['questions'] / result['seconds']:6.2f} q/s "
+            f"({result['malformed']} malformed, {result['duplicates']} duplicates)"
+        )
+
+
+if __name__ == "__main__":
+    main()
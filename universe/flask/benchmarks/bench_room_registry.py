@@ -0,0 +1,134 @@
+# Memory per thousand quiz rooms and join/leave cost of the room registry, against the dict-of-lists
+# rooms + sid -> dict socket_connections it replaced; ends with a concurrent join/leave consistency check.
+#
+#   python universe/flask/benchmarks/bench_room_registry.py --rooms 1000 --players 8 --big-room 2000
+import argparse
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from room_registry import RoomRegistry  # noqa: E402
+
+
+class LegacyRooms:
+    # The structures app.py used before: users as a list, sid -> {'username', 'room'} with no reverse index
+
+    def __init__(self):
+        self.rooms = {}
+        self.socket_connections = {}
+
+    def create_room(self, code, host, sid, quiz_title, created_at, files=(), bank_id=None):
+        self.rooms[code] = {'host': host, 'users': [host], 'quiz_title': quiz_title, 'created_at': created_at,
+                            'files': list(files), 'status': 'waiting', 'bank_id': bank_id}
+        self.socket_connections[sid] = {'username': host, 'room': code}
+
+    def join(self, code, username, sid):
+        if username not in self.rooms[code]['users']:
+            self.rooms[code]['users'].append(username)
+        self.socket_connections[sid] = {'username': username, 'room': code}
+
+    def leave(self, code, username):
+        if username in self.rooms[code]['users']:
+            self.rooms[code]['users'].remove(username)
+
+
+def populate(registry, rooms, players):
+    now = datetime.now()
+    for r in range(rooms):
+        code = f"R{r:06d}"
+        registry.create_room(code, f"host{r}", f"sid-{code}-host", "Quiz title", now, files=["notes.pdf"],
+                             bank_id=f"bank{r}")
+        for p in range(players - 1):
+            registry.join(code, f"user{r}-{p}", f"sid-{code}-{p}")
+
+
+def measure_memory(factory, rooms, players):
+    tracemalloc.start()
+    baseline = tracemalloc.take_snapshot()
+    registry = factory()
+    populate(registry, rooms, players)
+    used = sum(stat.size_diff for stat in tracemalloc.take_snapshot().compare_to(baseline, "filename"))
+    tracemalloc.stop()
+    return used, registry
+
+
+def time_big_room(factory, size):
+    # Every player joins one room, then leaves in reverse join order (the worst case for a list)
+    registry = factory()
+    registry.create_room("BIG", "host", "sid-host", "Big quiz", datetime.now())
+    start = time.perf_counter()
+    for p in range(size):
+        registry.join("BIG", f"user{p}", f"sid{p}")
+    joined = time.perf_counter() - start
+    start = time.perf_counter()
+    for p in reversed(range(size)):
+        registry.leave("BIG", f"user{p}")
+    left = time.perf_counter() - start
+    return joined / size * 1e6, left / size * 1e6
+
+
+def concurrency_check(threads=16, rounds=2000):
+    # Handlers joining, switching rooms and disconnecting at once must leave the indexes consistent
+    registry = RoomRegistry()
+
+    # A socket switching users in a room where its old user is the only member keeps the room
+    registry.create_room("SOLO", "alice", "solo-sid", "Quiz", datetime.now())
+    joined, departure = registry.join("SOLO", "bob", "solo-sid")
+    assert joined and registry.users("SOLO") == ["bob"] and not departure["emptied"], departure
+    registry.disconnect("solo-sid")
+    assert registry.get("SOLO") is None
+
+    for r in range(8):
+        registry.create_room(f"C{r}", f"host{r}", f"host-sid{r}", "Quiz", datetime.now())
+
+    def worker(w):
+        for i in range(rounds):
+            sid = f"w{w}-s{i % 3}"  # each user has up to three sockets
+            username = f"worker{w}" if i % 4 else f"worker{w}-alt"  # and a socket sometimes switches users
+            registry.join(f"C{(w + i) % 8}", username, sid)
+            if i % 5 == 0:
+                registry.disconnect(sid)
+            elif i % 7 == 0:
+                registry.leave(f"C{(w + i) % 8}", username)
+
+    pool = [threading.Thread(target=worker, args=(w,)) for w in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+
+    for w in range(threads):
+        for username in (f"worker{w}", f"worker{w}-alt"):
+            for sid in list(registry.sids_of(username)):
+                registry.disconnect(sid)
+    stats = registry.stats()
+    # Only the hosts remain once every worker socket is gone
+    assert stats["members"] == 8 and stats["users_connected"] == 8, stats
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rooms", type=int, default=1000)
+    parser.add_argument("--players", type=int, default=8, help="members per room, host included")
+    parser.add_argument("--big-room", type=int, default=2000, help="players in the join/leave timing room")
+    args = parser.parse_args()
+
+    per_thousand = 1000 / args.rooms
+    for label, factory in (("legacy dicts", LegacyRooms), ("room registry", RoomRegistry)):
+        used, _registry = measure_memory(factory, args.rooms, args.players)
+        join_us, leave_us = time_big_room(factory, args.big_room)
+        print(
+            f"{label:14s} {used * per_thousand / 1024:8.0f} KiB per 1000 rooms of {args.players}  "
+            f"join {join_us:6.2f}us  leave {leave_us:6.2f}us per player in a {args.big_room}-player room"
+        )
+    print(f"concurrent join/leave check passed: {concurrency_check()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# Import-time cost of the Flask app's dependencies, each measured in a fresh interpreter.
+# The "light" set is what app.py imports before it can serve auth, places and notes routes;
+# the "heavy" set is the RAG, quiz and ingestion stack that is now loaded lazily / in the background.
+#
+#   python universe/flask/benchmarks/bench_startup.py --runs 5
+#   python universe/flask/benchmarks/bench_startup.py --app     # also time `import app` (needs MONGO_PASS)
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+FLASK_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+LIGHT = ["flask", "flask_cors", "flask_socketio", "pymongo", "dotenv", "ingestion_jobs"]
+HEAVY = ["query_data", "langchain_loader", "quiz.quiz_query_data", "quiz.quiz_langchain_loader", "embeddings"]
+
+SNIPPET = """
+import sys, time
+sys.path.insert(0, {flask_dir!r})
+start = time.perf_counter()
+import {module}
+print(time.perf_counter() - start)
+"""
+
+
+def time_import(module, runs, env):
+    samples = []
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, "-c", SNIPPET.format(flask_dir=FLASK_DIR, module=module)],
+            capture_output=True, text=True, env=env
+        )
+        if result.returncode != 0:
+            error = (result.stderr.strip().splitlines() or ["failed"])[-1]
+            return None, error
+        samples.append(float(result.stdout.strip().splitlines()[-1]))
+    return statistics.median(samples), None
+
+
+def top_imports(module, env, limit):
+    # Largest cumulative entries from -X importtime among the module's direct imports
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import sys; sys.path.insert(0, {FLASK_DIR!r}); import {module}"],
+        capture_output=True, text=True, env=env
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2  # importtime indents two spaces per level
+        if depth == 1:
+            rows.append((int(cumulative_us), name.strip()))
+    return sorted(rows, reverse=True)[:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--app", action="store_true", help="also time importing app.py itself")
+    parser.add_argument("--top", type=int, default=8, help="show the slowest top-level imports of each heavy module")
+    args = parser.parse_args()
+
+    env = dict(os.environ, PRELOAD_ML_STACK="0")
+    groups = [("light", LIGHT), ("heavy", HEAVY)] + ([("app", ["app"])] if args.app else [])
+    for label, modules in groups:
+        print(f"[{label}]")
+        for module in modules:
+            seconds, error = time_import(module, args.runs, env)
+            if error:
+                print(f"  {module:32s} error: {error}")
+            else:
+                print(f"  {module:32s} {seconds * 1000:8.1f} ms")
+            if label == "heavy" and not error and args.top:
+                for cumulative_us, name in top_imports(module, env, args.top):
+                    print(f"      {name:28s} {cumulative_us / 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
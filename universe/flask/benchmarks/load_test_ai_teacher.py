@@ -0,0 +1,64 @@
+# Concurrent load test of POST /<username>/query against a running app.
+# Pair it with the fake LLM backend to exercise the whole pipeline offline:
+#
+#   python universe/flask/fake_llm_server.py --latency-ms 400 &
+#   LLM_BASE_URL=http://localhost:8089 python universe/flask/app.py &
+#   python universe/flask/benchmarks/load_test_ai_teacher.py --users alice bob --concurrency 32 --requests 200
+import argparse
+import json
+import statistics
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+QUESTIONS = [
+    "What is a binary search tree?",
+    "Explain the CAP theorem",
+    "What are the phases of mitosis?",
+    "Define Ohm's law",
+    "What is normalization in databases?",
+]
+
+
+def ask(base_url, username, question):
+    request = urllib.request.Request(
+        f"{base_url}/{username}/query",
+        data=json.dumps({"query": question}).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    start = time.perf_counter()
+    with urllib.request.urlopen(request, timeout=120) as response:
+        ok = response.status == 200
+        response.read()
+    return ok, (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--base-url", default="http://localhost:5000")
+    parser.add_argument("--users", nargs="+", default=["loadtest"])
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=100)
+    args = parser.parse_args()
+
+    def one(i):
+        try:
+            return ask(args.base_url, args.users[i % len(args.users)], QUESTIONS[i % len(QUESTIONS)])
+        except Exception:
+            return False, None
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(one, range(args.requests)))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(ms for ok, ms in results if ok)
+    failures = sum(1 for ok, _ms in results if not ok)
+    print(f"{args.requests} requests, concurrency {args.concurrency}, {elapsed:.1f}s, {args.requests / elapsed:.1f} req/s, {failures} failed")
+    if latencies:
+        print(f"p50={statistics.median(latencies):.0f}ms p95={latencies[int(0.95 * (len(latencies) - 1))]:.0f}ms max={latencies[-1]:.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
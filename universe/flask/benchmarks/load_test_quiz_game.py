@@ -0,0 +1,127 @@
+# In-process load test of the quiz game engine: several rooms with hundreds of simulated players each,
+# answering concurrently from a worker pool on real server timers. Reports answer ingestion latency,
+# round-end (scoring + leaderboard) time and the broadcast traffic of per-round leaderboard deltas
+# against sending the full leaderboard every round.
+#
+#   python universe/flask/benchmarks/load_test_quiz_game.py --rooms 4 --players 300 --questions 5
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from quiz.game_engine import game_stats, get_game, start_game  # noqa: E402
+
+
+def make_questions(count):
+    return [
+        {"question": f"Question {i}?", "options": ["A", "B", "C", "D"], "answer_index": i % 4}
+        for i in range(count)
+    ]
+
+
+def schedule(delay, fn):
+    timer = threading.Timer(delay, fn)
+    timer.daemon = True
+    timer.start()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rooms", type=int, default=4)
+    parser.add_argument("--players", type=int, default=300)
+    parser.add_argument("--questions", type=int, default=5)
+    parser.add_argument("--question-seconds", type=float, default=2.0)
+    parser.add_argument("--reveal-seconds", type=float, default=0.2)
+    parser.add_argument("--accuracy", type=float, default=0.6, help="share of players answering correctly")
+    parser.add_argument("--workers", type=int, default=32, help="threads delivering answers, like Socket.IO handlers")
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    pool = ThreadPoolExecutor(max_workers=args.workers)
+    latencies = []
+    latencies_lock = threading.Lock()
+    traffic = defaultdict(lambda: [0, 0])  # event -> [broadcasts, bytes per receiving client]
+    full_board_bytes = [0]
+    done = {}
+
+    def answer(game, username, index, choice):
+        start = time.perf_counter()
+        result = game.submit(username, index, answer_index=choice)
+        elapsed = time.perf_counter() - start
+        with latencies_lock:
+            latencies.append(elapsed)
+        if not result["accepted"] and result["reason"] != "Time is up":
+            print(f"rejected {username}: {result['reason']}")
+
+    def play_round(game, players, index, answer_index):
+        # Players answer at random moments within the first 80% of the question, in time order
+        started = time.monotonic()
+        plan = sorted((rng.uniform(0, args.question_seconds * 0.8), username) for username in players)
+        for delay, username in plan:
+            time.sleep(max(0.0, started + delay - time.monotonic()))
+            correct = rng.random() < args.accuracy
+            choice = answer_index if correct else (answer_index + rng.randint(1, 3)) % 4
+            pool.submit(answer, game, username, index, choice)
+
+    def emitter(room_code, players, questions):
+        def emit(event, payload):
+            size = len(json.dumps(payload))
+            with latencies_lock:
+                traffic[event][0] += 1
+                traffic[event][1] += size
+                if event == "leaderboard_delta":
+                    full_board_bytes[0] += len(json.dumps(get_game(room_code).leaderboard.top()))
+            if event == "round_started":
+                index = payload["questionIndex"]
+                threading.Thread(
+                    target=play_round, args=(get_game(room_code), players, index, questions[index]["answer_index"]),
+                    daemon=True
+                ).start()
+        return emit
+
+    questions = make_questions(args.questions)
+    start = time.perf_counter()
+    for r in range(args.rooms):
+        room_code = f"LOAD{r}"
+        players = [f"{room_code}-player{p}" for p in range(args.players)]
+        done[room_code] = threading.Event()
+        start_game(
+            room_code, questions, players, emit=emitter(room_code, players, questions), schedule=schedule,
+            on_finish=lambda game: done[game.room_code].set(),
+            question_seconds=args.question_seconds, reveal_seconds=args.reveal_seconds
+        )
+
+    for event in done.values():
+        event.wait()
+    elapsed = time.perf_counter() - start
+    pool.shutdown(wait=True)
+
+    stats = game_stats()
+    latencies.sort()
+    rounds = args.rooms * args.questions
+    print(f"{args.rooms} rooms x {args.players} players x {args.questions} questions in {elapsed:.1f}s")
+    print(f"answers: {len(latencies)} accepted+rejected, {stats['rejected']} rejected")
+    print(
+        f"submit latency: p50 {statistics.median(latencies) * 1e6:.0f}us  "
+        f"p99 {latencies[int(len(latencies) * 0.99) - 1] * 1e6:.0f}us  max {latencies[-1] * 1e6:.0f}us"
+    )
+    print(f"round end (scoring + leaderboard): {stats['round_end_ms_mean']}ms mean over {stats['rounds']} rounds")
+    for event, (count, size) in sorted(traffic.items()):
+        print(f"{event:18s} {count:5d} broadcasts, {size / max(count, 1):9.0f} bytes each")
+    delta_bytes = traffic["leaderboard_delta"][1]
+    print(
+        f"leaderboard per round: delta {delta_bytes / rounds:.0f} bytes vs full table "
+        f"{full_board_bytes[0] / rounds:.0f} bytes (x{args.players} receivers per broadcast)"
+    )
+
+
+if __name__ == "__main__":
+    main()
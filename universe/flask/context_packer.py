@@ -0,0 +1,123 @@
+import os
+
+from langchain_core.documents import Document
+
+from conversation_memory import estimate_tokens
+from lexical_index import tokenize
+
+# Token budget for the whole context section of a prompt
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "700"))
+# Vector hits below this relevance are dropped; lexical-only hits carry no score and are kept
+MIN_RELEVANCE = float(os.getenv("CONTEXT_MIN_RELEVANCE", "0.1"))
+# MMR trade-off between relevance (1.0) and novelty (0.0)
+MMR_LAMBDA = float(os.getenv("CONTEXT_MMR_LAMBDA", "0.7"))
+
+CONTEXT_SEPARATOR = "\n\n---\n\n"
+
+
+def _filter_relevant(results, min_relevance):
+    kept = [(doc, score) for doc, score in results if score is None or score >= min_relevance]
+    # Never leave the model with nothing when every hit is weak; the best one is still the best guess
+    if not kept and results:
+        kept = results[:1]
+    return kept
+
+
+def _merge_adjacent(results):
+    # Chunks overlap by chunk_overlap characters, so neighbours from one source are stitched back together
+    merged = []
+    by_source = {}
+    for rank, (doc, score) in enumerate(results):
+        start = doc.metadata.get("start_index")
+        source = doc.metadata.get("source")
+        if start is None or source is None:
+            merged.append((rank, doc, score))
+            continue
+        by_source.setdefault((source, doc.metadata.get("page")), []).append((rank, doc, score))
+
+    for group in by_source.values():
+        group.sort(key=lambda item: item[1].metadata["start_index"])
+        rank, current, score = group[0]
+        end = current.metadata["start_index"] + len(current.page_content)
+        text = current.page_content
+        for next_rank, doc, next_score in group[1:]:
+            start = doc.metadata["start_index"]
+            if start <= end:
+                overlap = end - start
+                text += doc.page_content[overlap:]
+                end = max(end, start + len(doc.page_content))
+                # The merged chunk ranks as its best member
+                rank = min(rank, next_rank)
+                score = _best(score, next_score)
+                continue
+            merged.append((rank, _with_text(current, text), score))
+            rank, current, score = next_rank, doc, next_score
+            end = start + len(doc.page_content)
+            text = doc.page_content
+        merged.append((rank, _with_text(current, text), score))
+
+    merged.sort(key=lambda item: item[0])
+    return [(doc, score) for _rank, doc, score in merged]
+
+
+def _best(a, b):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return max(a, b)
+
+
+def _with_text(doc, text):
+    if text == doc.page_content:
+        return doc
+    return Document(page_content=text, metadata=dict(doc.metadata))
+
+
+def _jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def _mmr_order(results, mmr_lambda):
+    # Relevance comes from the retrieval rank; redundancy from token overlap with what is already picked
+    count = len(results)
+    relevance = [1.0 - rank / count for rank in range(count)]
+    tokens = [set(tokenize(doc.page_content)) for doc, _score in results]
+    remaining = list(range(count))
+    order = []
+    while remaining:
+        best, best_value = None, None
+        for i in remaining:
+            redundancy = max((_jaccard(tokens[i], tokens[j]) for j in order), default=0.0)
+            value = mmr_lambda * relevance[i] - (1 - mmr_lambda) * redundancy
+            if best_value is None or value > best_value:
+                best, best_value = i, value
+        order.append(best)
+        remaining.remove(best)
+    return [results[i] for i in order]
+
+
+def pack_context(results, token_budget=CONTEXT_TOKEN_BUDGET, min_relevance=MIN_RELEVANCE, mmr_lambda=MMR_LAMBDA):
+    # results: best-first (Document, relevance or None). Returns (packed documents, context text).
+    candidates = _filter_relevant(results, min_relevance)
+    candidates = _merge_adjacent(candidates)
+    candidates = _mmr_order(candidates, mmr_lambda)
+
+    packed = []
+    used = 0
+    separator_cost = estimate_tokens(CONTEXT_SEPARATOR)
+    for doc, _score in candidates:
+        cost = estimate_tokens(doc.page_content) + (separator_cost if packed else 0)
+        if used + cost > token_budget:
+            continue  # a shorter chunk further down may still fit
+        packed.append(doc)
+        used += cost
+
+    if not packed and candidates:
+        # Budget smaller than the best chunk: send a truncated copy rather than nothing
+        doc = candidates[0][0]
+        packed.append(_with_text(doc, doc.page_content[: token_budget * 4]))
+
+    return packed, CONTEXT_SEPARATOR.join(doc.page_content for doc in packed)
@@ -0,0 +1,141 @@
+import re
+from threading import Lock
+
+# Defaults; each user can override them through /<username>/memory_settings
+DEFAULT_SETTINGS = {
+    "recent_turns": 6,  # turns kept verbatim
+    "summary_token_budget": 250,  # older turns are folded into a summary this size
+    "history_token_ceiling": 900,  # hard cap on the whole history section of the prompt
+}
+# Bounds on what users may set, so one account cannot blow up prompt size again
+SETTINGS_LIMITS = {
+    "recent_turns": (0, 20),
+    "summary_token_budget": (0, 1000),
+    "history_token_ceiling": (0, 2000),
+}
+
+_stats_lock = Lock()
+_stats = {
+    "prompts": 0,
+    "history_tokens_total": 0,
+    "history_tokens_max": 0,
+    "prompt_tokens_total": 0,
+    "prompt_tokens_max": 0,
+    "truncated_histories": 0,
+}
+
+
+def estimate_tokens(text):
+    # Roughly four characters per token for Llama-style tokenizers on English text
+    return (len(text) + 3) // 4 if text else 0
+
+
+def resolve_settings(user_settings):
+    settings = dict(DEFAULT_SETTINGS)
+    for key, value in (user_settings or {}).items():
+        if key in SETTINGS_LIMITS:
+            low, high = SETTINGS_LIMITS[key]
+            settings[key] = max(low, min(high, int(value)))
+    return settings
+
+
+def validate_settings(data):
+    settings = {}
+    for key, value in data.items():
+        if key not in SETTINGS_LIMITS:
+            raise ValueError(f"Unknown memory setting '{key}'")
+        low, high = SETTINGS_LIMITS[key]
+        if not isinstance(value, int) or isinstance(value, bool) or not low <= value <= high:
+            raise ValueError(f"'{key}' must be an integer between {low} and {high}")
+        settings[key] = value
+    return settings
+
+
+def _first_sentence(text, max_words):
+    sentence = re.split(r"(?<=[.!?])\s", text.strip(), maxsplit=1)[0]
+    words = sentence.split()
+    if len(words) > max_words:
+        return " ".join(words[:max_words]) + "..."
+    return " ".join(words)
+
+
+def _summarize_turn(turn):
+    return f"- Asked: {_first_sentence(turn['user'], 20)} Answered: {_first_sentence(turn['assistant'], 30)}"
+
+
+def _trim_summary(summary, budget):
+    # Drop the oldest summary lines until the summary fits its budget
+    lines = [line for line in summary.split("\n") if line]
+    while lines and estimate_tokens("\n".join(lines)) > budget:
+        lines.pop(0)
+    return "\n".join(lines)
+
+
+def fold(turns, summary, settings):
+    # Keep the last N turns verbatim and fold the rest into the rolling summary
+    keep = settings["recent_turns"]
+    older = turns[:-keep] if keep else list(turns)
+    recent = turns[-keep:] if keep else []
+    if older:
+        lines = [summary] if summary else []
+        lines.extend(_summarize_turn(turn) for turn in older)
+        summary = _trim_summary("\n".join(lines), settings["summary_token_budget"])
+    return recent, summary
+
+
+def _format_turn(turn):
+    return f"User: {turn['user']}\nAssistant: {turn['assistant']}"
+
+
+def build_history(turns, summary, settings):
+    ceiling = settings["history_token_ceiling"]
+    recent, summary = fold(turns, summary, settings)
+    summary_block = f"Summary of earlier conversation:\n{summary}" if summary else ""
+
+    # Newest turns are the most useful, so fill the ceiling from the end backwards
+    blocks = []
+    used = estimate_tokens(summary_block)
+    truncated = False
+    for turn in reversed(recent):
+        block = _format_turn(turn)
+        cost = estimate_tokens(block) + 1
+        if used + cost > ceiling:
+            truncated = True
+            break
+        blocks.insert(0, block)
+        used += cost
+
+    if summary_block and used > ceiling:
+        # The summary alone overflows (tiny ceiling): cut it to fit
+        summary_block = summary_block[: ceiling * 4]
+        truncated = True
+    if summary_block:
+        blocks.insert(0, summary_block)
+
+    if truncated:
+        with _stats_lock:
+            _stats["truncated_histories"] += 1
+    return "\n".join(blocks)
+
+
+def record_prompt(history, prompt):
+    history_tokens = estimate_tokens(history)
+    prompt_tokens = estimate_tokens(prompt)
+    with _stats_lock:
+        _stats["prompts"] += 1
+        _stats["history_tokens_total"] += history_tokens
+        _stats["history_tokens_max"] = max(_stats["history_tokens_max"], history_tokens)
+        _stats["prompt_tokens_total"] += prompt_tokens
+        _stats["prompt_tokens_max"] = max(_stats["prompt_tokens_max"], prompt_tokens)
+
+
+def memory_stats():
+    with _stats_lock:
+        stats = dict(_stats)
+    prompts = stats["prompts"]
+    history_total = stats.pop("history_tokens_total")
+    prompt_total = stats.pop("prompt_tokens_total")
+    stats["avg_history_tokens"] = round(history_total / prompts, 1) if prompts else None
+    stats["avg_prompt_tokens"] = round(prompt_total / prompts, 1) if prompts else None
+    stats["defaults"] = dict(DEFAULT_SETTINGS)
+    return stats
@@ -0,0 +1,168 @@
+import multiprocessing
+import os
+import signal
+import time
+from concurrent.futures import FIRST_COMPLETED, CancelledError, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from threading import Lock
+
+SUPPORTED_EXTENSIONS = ('.pdf', '.ppt', '.pptx', '.docx')
+
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", str(max(1, (os.cpu_count() or 2) - 1))))
+# A single file that takes longer than this to parse is abandoned, not the whole upload
+EXTRACT_TIMEOUT_SECONDS = int(os.getenv("EXTRACT_TIMEOUT_SECONDS", "120"))
+# The worker's alarm cannot interrupt a parser stuck in C code; past the timeout plus this grace the
+# parent gives up on the file and kills the pool's processes
+EXTRACT_KILL_GRACE_SECONDS = 10
+# How often the parent checks for files that have started running and so are on the clock
+_POLL_SECONDS = 1.0
+
+_pool = None
+_pool_lock = Lock()
+
+
+def extract_pages(file_path):
+    # Yields (page_number, text) one page (PDF) or slide (PowerPoint) at a time; Word files have no
+    # page structure and come back as a single section numbered None
+    file_name = os.path.basename(file_path)
+
+    if file_name.endswith('.pdf'):
+        from PyPDF2 import PdfReader
+
+        # Extract text from PDF
+        with open(file_path, 'rb') as f:
+            reader = PdfReader(f)
+            for page_number, page in enumerate(reader.pages, start=1):
+                yield page_number, page.extract_text() or ""
+
+    elif file_name.endswith(('.ppt', '.pptx')):
+        from pptx import Presentation
+
+        # Extract text from PowerPoint
+        presentation = Presentation(file_path)
+        for slide_number, slide in enumerate(presentation.slides, start=1):
+            text = ""
+            for shape in slide.shapes:
+                if shape.has_text_frame:
+                    text += "\n".join([p.text for p in shape.text_frame.paragraphs])
+            yield slide_number, text
+
+    elif file_name.endswith('.docx'):
+        from docx import Document as WordDocument
+
+        # Extract text from Word document
+        doc = WordDocument(file_path)
+        yield None, "\n".join([paragraph.text for paragraph in doc.paragraphs])
+
+
+def extract_text(file_path):
+    return "".join(text for _page, text in extract_pages(file_path))
+
+
+def _on_timeout(signum, frame):
+    raise TimeoutError("extraction timed out")
+
+
+def _extract_in_worker(file_path, timeout):
+    # Runs in a pool process; a timer bounds each file and any failure is returned, never raised
+    use_alarm = timeout and hasattr(signal, "SIGALRM")
+    if use_alarm:
+        signal.signal(signal.SIGALRM, _on_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return list(extract_pages(file_path)), None
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+def _pool_context():
+    # Workers never fork the web server itself (its threads, locks and sockets); a forkserver that only
+    # imports this module hands out clean processes, and spawn does the same where there is no forkserver.
+    # Each worker still imports the main script (app.py) as __mp_main__, so that script must not start
+    # any work on import: recovery and preloading wait for start_recovery/start_preload under __main__
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload([__name__])
+        return context
+    return multiprocessing.get_context("spawn")
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=EXTRACT_WORKERS, mp_context=_pool_context())
+        return _pool
+
+
+def _reset_pool(broken):
+    # A worker that died (e.g. a parser segfault) breaks the whole pool; start a fresh one
+    global _pool
+    with _pool_lock:
+        if _pool is not broken:
+            return  # already replaced
+        _pool = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+def _kill_pool(pool):
+    # The only way to free a worker that ignores its alarm; the pool's other files then fail as
+    # BrokenProcessPool and are retried on a fresh pool
+    for process in list((getattr(pool, "_processes", None) or {}).values()):
+        process.kill()
+    _reset_pool(pool)
+
+
+def extract_documents(file_paths, timeout=EXTRACT_TIMEOUT_SECONDS):
+    # Yields (file_path, pages, error) as files finish, fastest first; exactly one of pages/error is None.
+    # pages is a list of (page_number, text) in document order
+    if not file_paths:
+        return
+    attempts = {path: 0 for path in file_paths}
+    futures = {}  # future -> (file_path, pool it was submitted to)
+
+    def submit(path):
+        pool = _get_pool()
+        futures[pool.submit(_extract_in_worker, path, timeout)] = (path, pool)
+
+    for path in file_paths:
+        submit(path)
+    started = {}  # future -> when the parent first saw it on a worker
+    while futures:
+        wait_for = None
+        if timeout:
+            # The executor marks a call running once it is queued for a worker, one ahead of the workers;
+            # calls are picked up in submission order, so only the first EXTRACT_WORKERS are on the clock
+            now = time.monotonic()
+            for future in [future for future in futures if future.running()][:EXTRACT_WORKERS]:
+                started.setdefault(future, now)
+            deadlines = [started[future] + timeout + EXTRACT_KILL_GRACE_SECONDS for future in futures if future in started]
+            if deadlines:
+                wait_for = max(0.0, min(deadlines) - now)
+            if len(deadlines) < len(futures):
+                wait_for = min(wait_for, _POLL_SECONDS) if wait_for is not None else _POLL_SECONDS
+        done, _ = wait(futures, timeout=wait_for, return_when=FIRST_COMPLETED)
+        for future in done:
+            path, pool = futures.pop(future)
+            started.pop(future, None)
+            try:
+                pages, error = future.result()
+            except (BrokenProcessPool, CancelledError):
+                # Every in-flight file sees the crash; give each one more try on a fresh pool
+                _reset_pool(pool)
+                attempts[path] += 1
+                if attempts[path] < 2:
+                    submit(path)
+                    continue
+                pages, error = None, "extraction worker crashed"
+            yield path, pages, error
+        now = time.monotonic()
+        for future, since in list(started.items()):
+            if now - since >= timeout + EXTRACT_KILL_GRACE_SECONDS:
+                path, pool = futures.pop(future)
+                del started[future]
+                _kill_pool(pool)
+                yield path, None, "TimeoutError: extraction timed out"
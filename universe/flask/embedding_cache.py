@@ -0,0 +1,118 @@
+import hashlib
+import os
+import re
+import sqlite3
+from threading import Lock
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows; appends are then only serialised within one process
+    fcntl = None
+
+EMBED_CACHE_DIR = os.getenv("EMBED_CACHE_DIR", "universe/flask/embedding_cache")
+EMBED_CACHE_ENABLED = os.getenv("EMBED_CACHE", "1") != "0"
+
+_caches = {}
+_caches_lock = Lock()
+
+
+def text_key(text):
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+class EmbeddingCache:
+    # Content-addressed store of one model's embeddings. Vectors are float16 rows appended to
+    # <model>.f16 and read back through a memory map; <model>.sqlite3 maps text hash -> row.
+
+    def __init__(self, directory, model_name):
+        os.makedirs(directory, exist_ok=True)
+        slug = re.sub(r"[^A-Za-z0-9._-]+", "_", model_name)
+        self.vectors_path = os.path.join(directory, f"{slug}.f16")
+        self._lock = Lock()
+        self._conn = sqlite3.connect(os.path.join(directory, f"{slug}.sqlite3"), check_same_thread=False)
+        self._conn.executescript("""
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS entries (key BLOB PRIMARY KEY, row INTEGER NOT NULL) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL);
+        """)
+        row = self._conn.execute("SELECT value FROM meta WHERE name = 'dim'").fetchone()
+        self.dim = int(row[0]) if row else None
+        self._map = None
+        self._stats = {"hits": 0, "misses": 0, "bytes_saved": 0}
+
+    def _rows(self, needed):
+        # Remap only when a row past the current mapping is asked for (another writer appended)
+        if self._map is None or needed >= self._map.shape[0]:
+            rows = os.path.getsize(self.vectors_path) // (self.dim * 2)
+            self._map = np.memmap(self.vectors_path, dtype=np.float16, mode="r", shape=(rows, self.dim))
+        return self._map
+
+    def get_many(self, texts):
+        # Returns one float32 list per text, or None where the text has not been embedded before
+        keys = [text_key(t) for t in texts]
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                found.update(self._conn.execute(
+                    f"SELECT key, row FROM entries WHERE key IN ({','.join('?' * len(batch))})", batch
+                ).fetchall())
+            if found:
+                vectors = self._rows(max(found.values()))
+            results = []
+            for text, key in zip(texts, keys):
+                if key in found:
+                    results.append(vectors[found[key]].astype(np.float32).tolist())
+                    self._stats["hits"] += 1
+                    self._stats["bytes_saved"] += len(text.encode("utf-8"))
+                else:
+                    results.append(None)
+                    self._stats["misses"] += 1
+        return results
+
+    def put_many(self, texts, vectors):
+        if not texts:
+            return
+        block = np.asarray(vectors, dtype=np.float16)
+        with self._lock:
+            if self.dim is None:
+                self.dim = block.shape[1]
+                with self._conn:
+                    self._conn.execute("INSERT OR IGNORE INTO meta (name, value) VALUES ('dim', ?)", (str(self.dim),))
+            with open(self.vectors_path, "ab") as f:
+                if fcntl:
+                    fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    # Row numbers come from the file length under the lock, so concurrent workers never collide
+                    first_row = f.seek(0, os.SEEK_END) // (self.dim * 2)
+                    f.truncate(first_row * self.dim * 2)  # drop a torn row left by a crashed writer
+                    f.write(block.tobytes())
+                    f.flush()
+                finally:
+                    if fcntl:
+                        fcntl.flock(f, fcntl.LOCK_UN)
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO entries (key, row) VALUES (?, ?)",
+                    [(text_key(t), first_row + i) for i, t in enumerate(texts)]
+                )
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else None
+        stats["store_bytes"] = os.path.getsize(self.vectors_path) if os.path.exists(self.vectors_path) else 0
+        return stats
+
+
+def get_embedding_cache(model_name):
+    if not EMBED_CACHE_ENABLED:
+        return None
+    with _caches_lock:
+        if model_name not in _caches:
+            _caches[model_name] = EmbeddingCache(EMBED_CACHE_DIR, model_name)
+        return _caches[model_name]
@@ -0,0 +1,185 @@
+import os
+import queue
+import time
+from concurrent.futures import Future
+from threading import Lock, Thread
+
+from langchain_core.embeddings import Embeddings
+
+from embedding_cache import get_embedding_cache
+
+EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L12-v2"
+
+# Concurrent query encodes are collected for up to this long and run as one forward pass
+BATCH_WINDOW_MS = float(os.getenv("EMBED_BATCH_WINDOW_MS", "5"))
+MAX_BATCH_SIZE = int(os.getenv("EMBED_MAX_BATCH_SIZE", "32"))
+
+# One model per worker process, shared by the AI Teacher, quiz and ingestion paths
+_model = None
+_model_lock = Lock()
+_encode_lock = Lock()
+_stats_lock = Lock()
+
+_stats = {
+    "model_name": EMBEDDING_MODEL_NAME,
+    "load_seconds": None,
+    "encode_calls": 0,
+    "encoded_texts": 0,
+    "encode_seconds_total": 0.0,
+    "last_encode_ms": None,
+    "batches": 0,
+    "batched_queries": 0,
+    "max_batch_seen": 0,
+}
+
+
+def _load_model():
+    global _model
+    # Double-checked so concurrent socketio handlers never load the model twice
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                from langchain_huggingface import HuggingFaceEmbeddings
+
+                start = time.perf_counter()
+                _model = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME)
+                elapsed = time.perf_counter() - start
+                with _stats_lock:
+                    _stats["load_seconds"] = round(elapsed, 3)
+                print(f"Loaded embedding model {EMBEDDING_MODEL_NAME} in {elapsed:.2f}s")
+    return _model
+
+
+def _record_encode(count, elapsed):
+    with _stats_lock:
+        _stats["encode_calls"] += 1
+        _stats["encoded_texts"] += count
+        _stats["encode_seconds_total"] += elapsed
+        _stats["last_encode_ms"] = round(elapsed * 1000, 2)
+
+
+def _encode_batch(texts):
+    model = _load_model()
+    start = time.perf_counter()
+    with _encode_lock:
+        vectors = model.embed_documents(texts)
+    _record_encode(len(texts), time.perf_counter() - start)
+    return vectors
+
+
+class EmbeddingBatcher:
+    # Collects single-query encodes from concurrent requests and runs them as one batch
+
+    def __init__(self, window_ms=BATCH_WINDOW_MS, max_batch_size=MAX_BATCH_SIZE, encode=_encode_batch):
+        self.window = window_ms / 1000.0
+        self.max_batch_size = max(1, max_batch_size)
+        self._encode = encode
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = Lock()
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = Thread(target=self._run, name="embedding-batcher", daemon=True)
+                    self._thread.start()
+
+    def submit(self, text):
+        self._ensure_started()
+        future = Future()
+        self._queue.put((text, future))
+        return future
+
+    def embed(self, text):
+        return self.submit(text).result()
+
+    def _collect(self):
+        # Block for the first request, then keep the window open for stragglers
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            texts = [text for text, _future in batch]
+            try:
+                vectors = self._encode(texts)
+            except Exception as e:
+                for _text, future in batch:
+                    future.set_exception(e)
+                continue
+            with _stats_lock:
+                _stats["batches"] += 1
+                _stats["batched_queries"] += len(batch)
+                _stats["max_batch_seen"] = max(_stats["max_batch_seen"], len(batch))
+            for (_text, future), vector in zip(batch, vectors):
+                future.set_result(vector)
+
+
+_batcher = EmbeddingBatcher()
+
+
+class SharedEmbeddings(Embeddings):
+    # LangChain-compatible view over the process-wide model that records encode latency
+
+    def embed_documents(self, texts):
+        # Ingestion already batches its chunks, so it goes straight to the model. Chunks embedded
+        # before (by any user, for either store) come from the content-addressed cache instead.
+        texts = list(texts)
+        cache = get_embedding_cache(EMBEDDING_MODEL_NAME)
+        if cache is None:
+            return _encode_batch(texts)
+        vectors = cache.get_many(texts)
+        missing = list(dict.fromkeys(t for t, v in zip(texts, vectors) if v is None))
+        if missing:
+            encoded = dict(zip(missing, _encode_batch(missing)))
+            cache.put_many(missing, [encoded[t] for t in missing])
+            vectors = [encoded[t] if v is None else v for t, v in zip(texts, vectors)]
+        return vectors
+
+    def embed_query(self, text):
+        # Query encodes from concurrent requests share a forward pass
+        return _batcher.embed(text)
+
+
+_shared_embeddings = SharedEmbeddings()
+
+
+def get_embeddings():
+    return _shared_embeddings
+
+
+def warm_up_embeddings():
+    # Load the model and run one encode so the first real request does not pay for it
+    try:
+        start = time.perf_counter()
+        _shared_embeddings.embed_query("warm up")
+        print(f"Embedding model warm-up finished in {time.perf_counter() - start:.2f}s")
+    except Exception as e:
+        print(f"Error warming up embedding model: {e}")
+
+
+def embedding_stats():
+    with _stats_lock:
+        stats = dict(_stats)
+    calls = stats["encode_calls"]
+    stats["avg_encode_ms"] = round(stats["encode_seconds_total"] * 1000 / calls, 2) if calls else None
+    stats["encode_seconds_total"] = round(stats["encode_seconds_total"], 3)
+    batches = stats["batches"]
+    stats["avg_batch_size"] = round(stats["batched_queries"] / batches, 2) if batches else None
+    stats["batch_window_ms"] = BATCH_WINDOW_MS
+    stats["max_batch_size"] = MAX_BATCH_SIZE
+    stats["loaded"] = _model is not None
+    cache = get_embedding_cache(EMBEDDING_MODEL_NAME)
+    stats["cache"] = cache.stats() if cache else None
+    return stats
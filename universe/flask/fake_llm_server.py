@@ -0,0 +1,68 @@
+# Deterministic OpenAI-compatible chat server for offline load tests of the whole pipeline.
+#
+#   python universe/flask/fake_llm_server.py --port 8089 --latency-ms 400
+#   LLM_BASE_URL=http://localhost:8089 python universe/flask/app.py
+import argparse
+import json
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from llm_gateway import LLM_MODEL, fake_completion
+
+
+class FakeChatHandler(BaseHTTPRequestHandler):
+    latency = 0.0
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_error(404)
+            return
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        text = fake_completion(body.get("messages") or [{"content": ""}], body.get("max_tokens") or 300)
+
+        if body.get("stream"):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.end_headers()
+            words = text.split(" ")
+            for i, word in enumerate(words):
+                time.sleep(self.latency / len(words))
+                chunk = {
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": LLM_MODEL,
+                    "choices": [{"index": 0, "delta": {"role": "assistant", "content": word if i == 0 else " " + word}, "finish_reason": None}],
+                }
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+            self.wfile.write(b"data: [DONE]\n\n")
+            return
+
+        time.sleep(self.latency)
+        payload = json.dumps({
+            "id": "fake",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": LLM_MODEL,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": len(text.split()), "total_tokens": len(text.split())},
+        }).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency-ms", type=float, default=300)
+    args = parser.parse_args()
+
+    FakeChatHandler.latency = args.latency_ms / 1000.0
+    print(f"Fake LLM server on http://localhost:{args.port} ({args.latency_ms}ms per completion)")
+    ThreadingHTTPServer(("0.0.0.0", args.port), FakeChatHandler).serve_forever()
@@ -0,0 +1,115 @@
+import hashlib
+import os
+import sqlite3
+import time
+from threading import Lock
+
+MANIFEST_PATH = "universe/flask/ingest_manifest.sqlite3"
+
+_manifest = None
+_manifest_lock = Lock()
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class IngestManifest:
+    # Which (owner, file) versions each vector store already holds, keyed on content hash. The file's
+    # size and mtime at hashing time are kept too, so unchanged files are recognised without reading them
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript("""
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS manifest (
+                store TEXT NOT NULL,
+                owner TEXT NOT NULL,
+                source TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                chunks INTEGER NOT NULL,
+                updated_at REAL NOT NULL,
+                size INTEGER,
+                mtime_ns INTEGER,
+                PRIMARY KEY (store, owner, source)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS manifest_owner_hash ON manifest (owner, content_hash);
+        """)
+        # Manifests created before size and mtime were tracked; their files are hashed once more
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(manifest)")}
+        for column in ("size", "mtime_ns"):
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE manifest ADD COLUMN {column} INTEGER")
+
+    def entries(self, store, owner):
+        # source -> (content_hash, size, mtime_ns)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT source, content_hash, size, mtime_ns FROM manifest WHERE store = ? AND owner = ?",
+                (store, owner)
+            ).fetchall()
+        return {source: (content_hash, size, mtime_ns) for source, content_hash, size, mtime_ns in rows}
+
+    def record(self, store, owner, source, content_hash, chunks, size=None, mtime_ns=None):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO manifest (store, owner, source, content_hash, chunks, updated_at, size, mtime_ns) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (store, owner, source, content_hash, chunks, time.time(), size, mtime_ns)
+            )
+
+    def touch(self, store, owner, source, size, mtime_ns):
+        # The file was rewritten with the same content; remember its new stat so it is not hashed again
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE manifest SET size = ?, mtime_ns = ? WHERE store = ? AND owner = ? AND source = ?",
+                (size, mtime_ns, store, owner, source)
+            )
+
+    def remove(self, store, owner, source):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM manifest WHERE store = ? AND owner = ? AND source = ?",
+                (store, owner, source)
+            )
+
+
+def get_manifest():
+    global _manifest
+    with _manifest_lock:
+        if _manifest is None:
+            _manifest = IngestManifest(MANIFEST_PATH)
+    return _manifest
+
+
+def changed_files(store, owner, folder, extensions, names=None):
+    # Returns {file_name: (content_hash, size, mtime_ns)} for files that are new or whose content changed
+    # since last ingestion. Only files whose size or mtime moved are read and hashed. names, when given,
+    # limits the check to those files of the folder.
+    manifest = get_manifest()
+    known = manifest.entries(store, owner)
+    changed = {}
+    for file_name in os.listdir(folder) if names is None else names:
+        if not file_name.endswith(extensions):
+            continue
+        path = os.path.join(folder, file_name)
+        if not os.path.isfile(path):
+            continue
+        stat = os.stat(path)  # taken before hashing, so a write during hashing shows up next time
+        entry = known.get(file_name)
+        if entry and entry[1:] == (stat.st_size, stat.st_mtime_ns):
+            continue
+        content_hash = file_hash(path)
+        if entry and entry[0] == content_hash:
+            manifest.touch(store, owner, file_name, stat.st_size, stat.st_mtime_ns)
+            continue
+        changed[file_name] = (content_hash, stat.st_size, stat.st_mtime_ns)
+    return changed
@@ -0,0 +1,202 @@
+import gzip
+import json
+import os
+from threading import Lock
+
+from document_extraction import SUPPORTED_EXTENSIONS, extract_documents
+from ingest_manifest import changed_files, get_manifest
+from lexical_index import get_lexical_index
+from streaming_chunker import INGEST_BATCH_SIZE, batched, iter_chunks
+from vector_stores import (
+    chunk_id, course_collection_name, delete_source_chunks, get_vector_store, invalidate_vector_store,
+    owner_collection_name, store_is_empty
+)
+
+CHROMA_PATH = "universe/flask/chroma"
+
+# Extracted pages are kept by file content hash, so a file uploaded to both flows is parsed once
+EXTRACTION_CACHE_DIR = os.getenv("EXTRACTION_CACHE_DIR", "universe/flask/extraction_cache")
+EXTRACTION_CACHE_MAX_BYTES = int(os.getenv("EXTRACTION_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+_extraction_cache_lock = Lock()
+
+
+def _cache_path(content_hash):
+    return os.path.join(EXTRACTION_CACHE_DIR, f"{content_hash}.json.gz")
+
+
+def _load_cached_pages(content_hash):
+    path = _cache_path(content_hash)
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            pages = [tuple(page) for page in json.load(f)]
+        os.utime(path)  # mark as recently used for pruning
+        return pages
+    except (OSError, ValueError):
+        return None
+
+
+def _store_cached_pages(content_hash, pages):
+    os.makedirs(EXTRACTION_CACHE_DIR, exist_ok=True)
+    path = _cache_path(content_hash)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+        json.dump(pages, f)
+    os.replace(tmp_path, path)
+
+    with _extraction_cache_lock:
+        # Least recently used entries go first once the cache outgrows its budget
+        entries = sorted(
+            (entry.stat().st_mtime, entry.stat().st_size, entry.path)
+            for entry in os.scandir(EXTRACTION_CACHE_DIR) if entry.name.endswith(".json.gz")
+        )
+        total = sum(size for _mtime, size, _path in entries)
+        for _mtime, size, old_path in entries:
+            if total <= EXTRACTION_CACHE_MAX_BYTES:
+                break
+            try:
+                os.remove(old_path)
+            except OSError:
+                pass
+            total -= size
+
+
+def extract_with_cache(files):
+    # files maps path -> content hash; yields (path, pages, error) like extract_documents
+    to_extract = {}
+    for path, content_hash in files.items():
+        pages = _load_cached_pages(content_hash)
+        if pages is None:
+            to_extract[path] = content_hash
+        else:
+            yield path, pages, None
+    for path, pages, error in extract_documents(list(to_extract)):
+        if not error:
+            try:
+                _store_cached_pages(to_extract[path], pages)
+            except OSError as e:
+                print(f"Error caching extraction of {os.path.basename(path)}: {e}")
+        yield path, pages, error
+
+
+def _chunk_ids(owner, chunks):
+    return [chunk_id(owner, chunk.metadata["source"], chunk.metadata["chunk_index"]) for chunk in chunks]
+
+
+class CollectionSink:
+    # AI Teacher: the owner's own collection, or the shared course collection when a course is given,
+    # plus the BM25 index kept in step with it
+
+    def __init__(self, username, course=None):
+        self.username = username
+        self.course = course
+        self.store = course_collection_name(course) if course else owner_collection_name(username)
+        self._db = get_vector_store(CHROMA_PATH, self.store)
+        self._lexical = get_lexical_index(CHROMA_PATH, self.store)
+
+    def remove(self, source):
+        removed = delete_source_chunks(self._db, source, owner=self.username)
+        self._lexical.delete_source(source, owner=self.username)
+        if removed:
+            invalidate_vector_store(CHROMA_PATH, self.store)
+        return removed
+
+    def write(self, chunks):
+        for chunk in chunks:
+            chunk.metadata["owner"] = self.username
+            if self.course:
+                chunk.metadata["course"] = self.course
+        # Chroma persists on write
+        self._db.add_documents(chunks, ids=_chunk_ids(self.username, chunks))
+        self._lexical.add_documents(chunks)
+        invalidate_vector_store(CHROMA_PATH, self.store)
+
+
+class PathStoreSink:
+    # Quiz: one store directory per user
+
+    def __init__(self, username):
+        self.username = username
+        self.store = CHROMA_PATH+f"_{username}"
+        self._db = get_vector_store(self.store)
+
+    def remove(self, source):
+        removed = delete_source_chunks(self._db, source)
+        if removed:
+            invalidate_vector_store(self.store)
+        return removed
+
+    def write(self, chunks):
+        self._db.add_documents(chunks, ids=_chunk_ids(self.username, chunks))
+        invalidate_vector_store(self.store)
+
+
+class IngestionPipeline:
+    # Changed files in a user's upload folder -> extractor -> chunker -> sink, one file at a time.
+    # upload_folder(username) names the folder and sink(username, **params) opens the destination;
+    # extractor and chunker default to the cached process-pool extraction and the page-streaming chunker.
+
+    def __init__(self, upload_folder, sink, extractor=extract_with_cache, chunker=iter_chunks,
+                 batch_size=INGEST_BATCH_SIZE):
+        self.upload_folder = upload_folder
+        self.sink = sink
+        self.extractor = extractor
+        self.chunker = chunker
+        self.batch_size = batch_size
+
+    # progress, when given, is called with "parsing" and "embedding" as the job moves along.
+    # files, when given, names the uploads to ingest; otherwise the whole upload folder is scanned
+    def run(self, username, progress=None, files=None, **params):
+        if progress:
+            progress("parsing")
+        sink = self.sink(username, **params)
+        folder = self.upload_folder(username)
+        changed = changed_files(sink.store, username, folder, SUPPORTED_EXTENSIONS, names=files)
+        if not changed:
+            print("No new documents to process.")
+            return
+
+        embedding = False
+        paths = {os.path.join(folder, file_name): version[0] for file_name, version in changed.items()}
+        # A file that fails or times out is skipped (and retried when it is uploaded again) without failing the rest
+        for path, pages, error in self.extractor(paths):
+            source = os.path.basename(path)
+            if error:
+                print(f"Error extracting {source}: {error}")
+                continue
+            if progress and not embedding:
+                progress("embedding")
+                embedding = True
+
+            # A re-uploaded file replaces its previous version rather than adding to it
+            removed = sink.remove(source)
+            if removed:
+                print(f"Removed {removed} stale chunks of {source}")
+            chunk_count = 0
+            for batch in batched(self.chunker(pages, {"source": source}), self.batch_size):
+                sink.write(batch)
+                chunk_count += len(batch)
+            print(f"Indexed {chunk_count} chunks of {source} into {sink.store}")
+            content_hash, size, mtime_ns = changed[source]
+            get_manifest().record(sink.store, username, source, content_hash, chunk_count, size, mtime_ns)
+
+    def remove(self, username, source, **params):
+        # Deletes one uploaded file: its chunks in the sink, its manifest entry and the upload itself
+        sink = self.sink(username, **params)
+        removed = sink.remove(source)
+        get_manifest().remove(sink.store, username, source)
+        path = os.path.join(self.upload_folder(username), source)
+        if os.path.exists(path):
+            os.remove(path)
+        print(f"Deleted {source} ({removed} chunks) from {sink.store}")
+        return removed
+
+
+def legacy_uploads(username, upload_folder):
+    # Files of a user who uploaded before per-owner collections existed: their owner collection is still
+    # empty while their upload folder is not. These are re-ingested from the folder; the shared default
+    # collection is never copied from, as the old global tracker left each file name holding whichever
+    # user uploaded it first.
+    if not os.path.isdir(upload_folder) or not store_is_empty(CollectionSink(username)._db):
+        return []
+    return sorted(f for f in os.listdir(upload_folder) if f.endswith(SUPPORTED_EXTENSIONS))
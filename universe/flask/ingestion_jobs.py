@@ -0,0 +1,159 @@
+import os
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from threading import Lock, Thread
+
+# Job states, in order
+QUEUED = "queued"
+PARSING = "parsing"
+EMBEDDING = "embedding"
+DONE = "done"
+FAILED = "failed"
+ACTIVE_STATES = (QUEUED, PARSING, EMBEDDING)
+
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+# Uploads beyond this many unfinished jobs per user are refused until one finishes; of those, one per
+# kind runs at a time and the rest wait their turn
+MAX_ACTIVE_JOBS_PER_USER = int(os.getenv("INGEST_MAX_ACTIVE_JOBS_PER_USER", "2"))
+
+_executor = ThreadPoolExecutor(max_workers=INGEST_WORKERS, thread_name_prefix="ingest")
+_jobs_collection = None
+_runners = {}  # job kind -> fn(username, files=..., progress=..., **params)
+_active = {}  # username -> number of unfinished jobs in this process
+_waiting = {}  # (username, kind) with a job running -> deque of (job id, files, params) queued behind it
+_active_lock = Lock()
+
+
+class TooManyJobsError(Exception):
+    pass
+
+
+def register_runner(kind, fn):
+    _runners[kind] = fn
+
+
+def init_ingestion_jobs(collection):
+    # Only binds the collection, so importing the app has no side effects; the serving process starts
+    # recovery with recover_ingestion_jobs()
+    global _jobs_collection
+    _jobs_collection = collection
+
+
+def recover_ingestion_jobs():
+    # Index creation and recovery talk to the database, so they run off the startup path
+    Thread(target=_recover_jobs, args=(datetime.now(),), name="ingest-recovery", daemon=True).start()
+
+
+def _recover_jobs(started_at):
+    try:
+        _jobs_collection.create_index([("username", 1), ("created_at", -1)])
+        _jobs_collection.create_index("state")
+
+        # Jobs cut off by a restart are picked up again; the loaders only process files not yet ingested.
+        # Jobs submitted since this process started are already queued here and are left alone
+        for job in _jobs_collection.find({"state": {"$in": list(ACTIVE_STATES)}, "created_at": {"$lt": started_at}}):
+            if job.get("kind") in _runners:
+                print(f"Requeueing interrupted ingestion job {job['_id']}")
+                _set_state(job["_id"], QUEUED)
+                _reserve(job["username"], enforce_cap=False)
+                _enqueue(job["_id"], job["username"], job["kind"], job.get("files"), job.get("params") or {})
+            else:
+                _set_state(job["_id"], FAILED, error="Interrupted by a restart")
+    except Exception as e:
+        print(f"Error recovering ingestion jobs: {e}")
+
+
+def _set_state(job_id, state, **fields):
+    fields.update({"state": state, "updated_at": datetime.now()})
+    _jobs_collection.update_one({"_id": job_id}, {"$set": fields})
+
+
+def _reserve(username, enforce_cap):
+    with _active_lock:
+        if enforce_cap and _active.get(username, 0) >= MAX_ACTIVE_JOBS_PER_USER:
+            raise TooManyJobsError("Too many uploads are still being processed; try again once one finishes")
+        _active[username] = _active.get(username, 0) + 1
+
+
+def _enqueue(job_id, username, kind, files, params):
+    # Two pipelines over the same upload folder and store would interleave one's removal of a file's
+    # chunks with the other's writes, so a user's jobs of one kind run one after another
+    key = (username, kind)
+    with _active_lock:
+        if key in _waiting:
+            _waiting[key].append((job_id, files, params))
+            return
+        _waiting[key] = deque()
+    _executor.submit(_run_job, job_id, username, kind, files, params)
+
+
+def _run_next(username, kind):
+    key = (username, kind)
+    with _active_lock:
+        if not _waiting[key]:
+            del _waiting[key]
+            return
+        job_id, files, params = _waiting[key].popleft()
+    _executor.submit(_run_job, job_id, username, kind, files, params)
+
+
+def _run_job(job_id, username, kind, files, params):
+    # A job ingests the files it was submitted with, never the rest of the user's upload folder
+    try:
+        _runners[kind](username, files=files, progress=lambda state: _set_state(job_id, state), **params)
+        _set_state(job_id, DONE, finished_at=datetime.now())
+    except Exception as e:
+        print(f"Ingestion job {job_id} failed: {e}")
+        _set_state(job_id, FAILED, error=str(e), finished_at=datetime.now())
+    finally:
+        _release(username)
+        _run_next(username, kind)
+
+
+def _release(username):
+    with _active_lock:
+        _active[username] -= 1
+        if not _active[username]:
+            del _active[username]
+
+
+def submit_ingestion_job(username, kind, files, **params):
+    _reserve(username, enforce_cap=True)
+
+    job_id = uuid.uuid4().hex
+    now = datetime.now()
+    try:
+        _jobs_collection.insert_one({
+            "_id": job_id,
+            "username": username,
+            "kind": kind,
+            "files": files,
+            "params": params,
+            "state": QUEUED,
+            "created_at": now,
+            "updated_at": now,
+        })
+    except Exception:
+        _release(username)
+        raise
+    _enqueue(job_id, username, kind, files, params)
+    return job_id
+
+
+def get_job(job_id):
+    job = _jobs_collection.find_one({"_id": job_id})
+    if not job:
+        return None
+    return {
+        "job_id": job["_id"],
+        "username": job["username"],
+        "kind": job["kind"],
+        "files": job.get("files", []),
+        "state": job["state"],
+        "error": job.get("error"),
+        "created_at": job["created_at"].isoformat(),
+        "updated_at": job["updated_at"].isoformat(),
+        "finished_at": job["finished_at"].isoformat() if job.get("finished_at") else None,
+    }
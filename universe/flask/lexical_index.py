@@ -0,0 +1,164 @@
+import hashlib
+import json
+import math
+import os
+import re
+import sqlite3
+from collections import Counter
+from threading import Lock
+
+from langchain_core.documents import Document
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+# Reciprocal-rank fusion constant; 60 is the usual choice and keeps either ranking from dominating
+RRF_K = 60
+
+# Keeps course codes and dotted/hyphenated terms (cs301, k-means, 802.11) as single tokens
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[._-][a-z0-9]+)*")
+_STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "has", "how", "in", "is", "it",
+    "of", "on", "or", "that", "the", "this", "to", "was", "what", "when", "where", "which", "who",
+    "why", "with", "does", "do", "explain", "define",
+}
+
+_indexes = {}
+_indexes_lock = Lock()
+
+
+def tokenize(text):
+    return [token for token in _TOKEN_RE.findall(text.lower()) if token not in _STOPWORDS]
+
+
+# Stable key for a chunk, computable both from Chroma results and at ingestion time
+def chunk_key(doc):
+    digest = hashlib.sha1(doc.page_content.encode("utf-8")).hexdigest()[:16]
+    return f"{doc.metadata.get('source')}:{doc.metadata.get('start_index')}:{digest}"
+
+
+class LexicalIndex:
+    # Incremental BM25 inverted index stored in one SQLite file next to the Chroma data
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self._lock = Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript("""
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS docs (
+                doc_id INTEGER PRIMARY KEY,
+                chunk_key TEXT UNIQUE,
+                length INTEGER NOT NULL,
+                content TEXT NOT NULL,
+                metadata TEXT NOT NULL,
+                source TEXT,
+                owner TEXT
+            );
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT NOT NULL,
+                doc_id INTEGER NOT NULL,
+                tf INTEGER NOT NULL,
+                PRIMARY KEY (term, doc_id)
+            ) WITHOUT ROWID;
+        """)
+        # Indexes created before source/owner columns existed get them backfilled from the metadata
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(docs)")}
+        if "source" not in columns:
+            with self._conn:
+                self._conn.execute("ALTER TABLE docs ADD COLUMN source TEXT")
+                self._conn.execute("ALTER TABLE docs ADD COLUMN owner TEXT")
+                self._conn.execute("UPDATE docs SET source = json_extract(metadata, '$.source'), owner = json_extract(metadata, '$.owner')")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS docs_source ON docs (source, owner)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS postings_doc ON postings (doc_id)")
+
+    def add_documents(self, chunks):
+        with self._lock, self._conn:
+            for chunk in chunks:
+                terms = Counter(tokenize(chunk.page_content))
+                cursor = self._conn.execute(
+                    "INSERT OR IGNORE INTO docs (chunk_key, length, content, metadata, source, owner) VALUES (?, ?, ?, ?, ?, ?)",
+                    (chunk_key(chunk), sum(terms.values()), chunk.page_content, json.dumps(chunk.metadata),
+                     chunk.metadata.get("source"), chunk.metadata.get("owner"))
+                )
+                if cursor.rowcount == 0:
+                    continue  # already indexed
+                doc_id = cursor.lastrowid
+                self._conn.executemany(
+                    "INSERT INTO postings (term, doc_id, tf) VALUES (?, ?, ?)",
+                    [(term, doc_id, tf) for term, tf in terms.items()]
+                )
+
+    def delete_source(self, source, owner=None):
+        with self._lock, self._conn:
+            if owner is None:
+                doc_ids = self._conn.execute("SELECT doc_id FROM docs WHERE source = ?", (source,)).fetchall()
+            else:
+                doc_ids = self._conn.execute("SELECT doc_id FROM docs WHERE source = ? AND owner = ?", (source, owner)).fetchall()
+            self._conn.executemany("DELETE FROM postings WHERE doc_id = ?", doc_ids)
+            self._conn.executemany("DELETE FROM docs WHERE doc_id = ?", doc_ids)
+        return len(doc_ids)
+
+    def vacuum(self):
+        # Reclaims the pages freed by deleted sources
+        with self._lock:
+            self._conn.execute("VACUUM")
+
+    def search(self, query, k=10):
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+        with self._lock:
+            doc_count, total_length = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(length), 0) FROM docs").fetchone()
+            if not doc_count:
+                return []
+            avg_length = total_length / doc_count
+
+            scores = Counter()
+            for term in terms:
+                rows = self._conn.execute(
+                    "SELECT p.doc_id, p.tf, d.length FROM postings p JOIN docs d ON d.doc_id = p.doc_id WHERE p.term = ?",
+                    (term,)
+                ).fetchall()
+                if not rows:
+                    continue
+                idf = math.log(1 + (doc_count - len(rows) + 0.5) / (len(rows) + 0.5))
+                for doc_id, tf, length in rows:
+                    scores[doc_id] += idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * length / avg_length))
+
+            top = scores.most_common(k)
+            if not top:
+                return []
+            placeholders = ",".join("?" for _ in top)
+            rows = self._conn.execute(
+                f"SELECT doc_id, content, metadata FROM docs WHERE doc_id IN ({placeholders})",
+                [doc_id for doc_id, _score in top]
+            ).fetchall()
+        docs = {doc_id: Document(page_content=content, metadata=json.loads(metadata)) for doc_id, content, metadata in rows}
+        return [(docs[doc_id], score) for doc_id, score in top if doc_id in docs]
+
+
+def get_lexical_index(persist_directory, collection_name):
+    path = os.path.join(persist_directory, "lexical", f"{collection_name}.sqlite3")
+    with _indexes_lock:
+        index = _indexes.get(path)
+        if index is None:
+            index = LexicalIndex(path)
+            _indexes[path] = index
+    return index
+
+
+def reciprocal_rank_fusion(*rankings, k=None):
+    # Each ranking is a best-first list of (Document, score); returns (Document, fused score) best-first
+    fused = {}
+    docs = {}
+    for ranking in rankings:
+        for rank, (doc, _score) in enumerate(ranking):
+            key = chunk_key(doc)
+            docs.setdefault(key, doc)
+            fused[key] = fused.get(key, 0.0) + 1.0 / (RRF_K + rank + 1)
+    ordered = sorted(fused.items(), key=lambda item: item[1], reverse=True)
+    if k is not None:
+        ordered = ordered[:k]
+    return [(docs[key], score) for key, score in ordered]
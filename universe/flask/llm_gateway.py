@@ -0,0 +1,269 @@
+import hashlib
+import json
+import os
+import random
+import re
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from threading import BoundedSemaphore, Lock
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+LLM_MODEL = "meta-llama/Llama-3.2-3B-Instruct"
+
+# "huggingface" (default) or "fake" for the deterministic in-process backend.
+# LLM_BASE_URL points the huggingface backend at any OpenAI-compatible server, e.g. fake_llm_server.py.
+LLM_BACKEND = os.getenv("LLM_BACKEND", "huggingface")
+LLM_BASE_URL = os.getenv("LLM_BASE_URL")
+
+LLM_DEADLINE_SECONDS = float(os.getenv("LLM_DEADLINE_SECONDS", "30"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_BACKOFF_SECONDS = float(os.getenv("LLM_BACKOFF_SECONDS", "0.5"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+# Fire a second identical request if the first has not answered after this long (0 disables hedging)
+LLM_HEDGE_AFTER_MS = float(os.getenv("LLM_HEDGE_AFTER_MS", "0"))
+
+
+class LLMError(Exception):
+    pass
+
+
+class HuggingFaceBackend:
+    # One InferenceClient per process; huggingface_hub reuses pooled HTTP sessions underneath
+
+    def __init__(self, base_url=None):
+        from huggingface_hub import InferenceClient
+
+        if base_url:
+            self.client = InferenceClient(base_url=base_url, api_key=os.getenv("HUGGINGFACE_API") or "fake", timeout=LLM_DEADLINE_SECONDS)
+        else:
+            self.client = InferenceClient(api_key=os.getenv("HUGGINGFACE_API"), timeout=LLM_DEADLINE_SECONDS)
+
+    def complete(self, messages, max_tokens):
+        completion = self.client.chat.completions.create(
+            model=LLM_MODEL,
+            messages=messages,
+            max_tokens=max_tokens
+        )
+        return completion.choices[0].message["content"].strip()
+
+    def stream(self, messages, max_tokens):
+        stream = self.client.chat.completions.create(
+            model=LLM_MODEL,
+            messages=messages,
+            max_tokens=max_tokens,
+            stream=True
+        )
+        for chunk in stream:
+            token = chunk.choices[0].delta.content
+            if token:
+                yield token
+
+
+# Numbered passages in a batched MCQ prompt ("[1] text...")
+_FAKE_PASSAGE_RE = re.compile(r"^\[(\d+)\] (.*)$", re.MULTILINE)
+
+
+def _fake_mcq_batch(prompt, digest):
+    # A well-formed reply to the quiz MCQ prompt, one question per numbered passage
+    items = []
+    for number, first_line in _FAKE_PASSAGE_RE.findall(prompt):
+        words = " ".join(first_line.split()[:8])
+        n = int(number)
+        items.append({
+            "source": n,
+            "question": f"According to passage {n}, which statement follows from: {words}?",
+            "options": [f"Option {letter} {digest[n:n + 6]}" for letter in "ABCD"],
+            "answer_index": int(digest[n], 16) % 4,
+        })
+    return json.dumps(items)
+
+
+def fake_completion(messages, max_tokens):
+    # Same prompt, same answer: lets the whole pipeline be load-tested offline and reproducibly
+    prompt = messages[-1]["content"]
+    digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+    if '"answer_index"' in prompt:
+        return _fake_mcq_batch(prompt, digest)
+    words = [f"token{digest[i:i + 4]}" for i in range(0, min(len(digest), max_tokens * 4), 4)]
+    return "Fake answer " + " ".join(words)
+
+
+class FakeBackend:
+    def __init__(self, latency_ms=None):
+        self.latency = float(os.getenv("FAKE_LLM_LATENCY_MS", "50") if latency_ms is None else latency_ms) / 1000.0
+
+    def complete(self, messages, max_tokens):
+        time.sleep(self.latency)
+        return fake_completion(messages, max_tokens)
+
+    def stream(self, messages, max_tokens):
+        words = fake_completion(messages, max_tokens).split(" ")
+        for i, word in enumerate(words):
+            time.sleep(self.latency / len(words))
+            yield word if i == 0 else " " + word
+
+
+def _make_backend():
+    if LLM_BACKEND == "fake":
+        return FakeBackend()
+    return HuggingFaceBackend(LLM_BASE_URL)
+
+
+class LLMGateway:
+    def __init__(self, backend=None, max_concurrency=LLM_MAX_CONCURRENCY, max_retries=LLM_MAX_RETRIES,
+                 hedge_after_ms=LLM_HEDGE_AFTER_MS, deadline_seconds=LLM_DEADLINE_SECONDS):
+        self._backend = backend
+        self._backend_lock = Lock()
+        self._slots = BoundedSemaphore(max_concurrency)
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.hedge_after = hedge_after_ms / 1000.0
+        self.deadline_seconds = deadline_seconds
+        # Every backend call holds a slot until it finishes, so one worker per slot is enough
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="llm")
+        self._stats_lock = Lock()
+        self._stats = {
+            "calls": 0,
+            "failures": 0,
+            "retries": 0,
+            "hedges": 0,
+            "hedge_wins": 0,
+            "latency_ms_total": 0.0,
+        }
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            with self._backend_lock:
+                if self._backend is None:
+                    self._backend = _make_backend()
+        return self._backend
+
+    def _count(self, key, amount=1):
+        with self._stats_lock:
+            self._stats[key] += amount
+
+    def _acquire(self, deadline):
+        if not self._slots.acquire(timeout=max(0.0, deadline - time.monotonic())):
+            raise LLMError("Too many concurrent LLM requests; try again shortly")
+
+    def _submit(self, messages, max_tokens):
+        # The slot (already acquired) belongs to the backend call and is freed when that call finishes,
+        # not when the caller stops waiting, so abandoned and hedged calls still count against max_concurrency
+        try:
+            future = self._executor.submit(self.backend.complete, messages, max_tokens)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _future: self._slots.release())
+        return future
+
+    def _attempt(self, messages, max_tokens, deadline):
+        # One try, hedged: if the primary is slow, race a duplicate and take whichever finishes first
+        self._acquire(deadline)
+        primary = self._submit(messages, max_tokens)
+        pending = {primary}
+        if self.hedge_after > 0:
+            done, _ = wait(pending, timeout=min(self.hedge_after, max(0.0, deadline - time.monotonic())))
+            # A hedge only goes out if a slot is free right now; it never queues behind other callers
+            if not done and time.monotonic() < deadline and self._slots.acquire(blocking=False):
+                pending.add(self._submit(messages, max_tokens))
+                self._count("hedges")
+        error = None
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is not primary:
+                        self._count("hedge_wins")
+                    return future.result()
+                error = future.exception()
+        if error is not None:
+            raise error
+        raise TimeoutError("LLM request exceeded its deadline")
+
+    def _backoff(self, attempt, deadline):
+        delay = LLM_BACKOFF_SECONDS * (2 ** attempt) * (0.5 + random.random() / 2)
+        if time.monotonic() + delay >= deadline:
+            return False
+        time.sleep(delay)
+        return True
+
+    def complete(self, messages, max_tokens=300, deadline_seconds=None):
+        start = time.monotonic()
+        deadline = start + (deadline_seconds or self.deadline_seconds)
+        self._count("calls")
+        attempt = 0
+        while True:
+            try:
+                text = self._attempt(messages, max_tokens, deadline)
+                self._count("latency_ms_total", (time.monotonic() - start) * 1000)
+                return text
+            except Exception as e:
+                if attempt >= self.max_retries or not self._backoff(attempt, deadline):
+                    self._count("failures")
+                    raise LLMError(str(e)) from e
+                attempt += 1
+                self._count("retries")
+                print(f"Retrying LLM request after error: {e}")
+
+    def stream(self, messages, max_tokens=300, deadline_seconds=None):
+        # Retries only before the first token; once text has gone to the client it cannot be replayed
+        start = time.monotonic()
+        deadline = start + (deadline_seconds or self.deadline_seconds)
+        self._count("calls")
+        # The stream runs on the caller's thread, so the caller holds the slot for as long as it reads
+        try:
+            self._acquire(deadline)
+        except LLMError:
+            self._count("failures")
+            raise
+        try:
+            attempt = 0
+            while True:
+                started = False
+                try:
+                    for token in self.backend.stream(messages, max_tokens):
+                        started = True
+                        yield token
+                        if time.monotonic() > deadline:
+                            raise TimeoutError("LLM stream exceeded its deadline")
+                    self._count("latency_ms_total", (time.monotonic() - start) * 1000)
+                    return
+                except Exception as e:
+                    if started or attempt >= self.max_retries or not self._backoff(attempt, deadline):
+                        self._count("failures")
+                        raise LLMError(str(e)) from e
+                    attempt += 1
+                    self._count("retries")
+        finally:
+            self._slots.release()
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        succeeded = stats["calls"] - stats["failures"]
+        latency_total = stats.pop("latency_ms_total")
+        stats["avg_latency_ms"] = round(latency_total / succeeded, 2) if succeeded else None
+        stats["backend"] = LLM_BACKEND
+        stats["max_concurrency"] = self.max_concurrency
+        stats["max_retries"] = self.max_retries
+        stats["hedge_after_ms"] = self.hedge_after * 1000
+        return stats
+
+
+_gateway = LLMGateway()
+
+
+def get_llm():
+    return _gateway
+
+
+def llm_stats():
+    return _gateway.stats()
@@ -1,14 +1,24 @@
 import os
-from pymongo import MongoClient
-from langchain_chroma import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from threading import Lock
+from pymongo import MongoClient, UpdateOne
+from pymongo.errors import BulkWriteError
 from langchain.prompts import ChatPromptTemplate
-from huggingface_hub import InferenceClient
+from llm_gateway import get_llm
 from dotenv import load_dotenv
+from vector_stores import get_vector_store, get_store_version, owner_collection_name, course_collection_name
+from embeddings import get_embeddings
+import answer_cache
+from lexical_index import get_lexical_index, reciprocal_rank_fusion, chunk_key
+from context_packer import pack_context
+import conversation_memory
 
 load_dotenv()
 
 CHROMA_PATH = "universe/flask/chroma"
+# Candidates pulled from each of the vector and lexical rankings before fusion
+RETRIEVAL_CANDIDATES = 20
 
 PROMPT_TEMPLATE = """
 You are a helpful assistant. Answer the user's question using only the context provided below and the conversation history.
@@ -25,100 +35,478 @@ Question:
 Answer:
 """
 
-# Function to load memory from MongoDB
+# Unfolded turns may run this far past recent_turns before they are folded, so the summary is rewritten in batches
+FOLD_BATCH = 4
+
+_mongo_clients = {}
+_mongo_clients_lock = Lock()
+
+
+# One pooled client per URI instead of a new connection per call
+def _get_db(mongodb_uri):
+    with _mongo_clients_lock:
+        client = _mongo_clients.get(mongodb_uri)
+        if client is None:
+            client = MongoClient(mongodb_uri)
+            db = client.Universe
+            db.memory_turns.create_index([("user_id", 1), ("ts", 1)])
+            # Turns copied from a legacy memory array are keyed by their position in it, so a migration
+            # interrupted part way can simply run again
+            db.memory_turns.create_index(
+                [("user_id", 1), ("legacy_seq", 1)], unique=True,
+                partialFilterExpression={"legacy_seq": {"$exists": True}}
+            )
+            db.memory.create_index("user_id")
+            _mongo_clients[mongodb_uri] = client
+    return client.Universe
+
+
+# Move a legacy {"memory": [...]} document into append-only turn records. The turns are upserted first
+# (idempotently, by position) and the array is only removed once they are all stored, so a crash or a
+# Mongo error in between leaves the history in place for the next attempt. load_memory only reads the
+# newest turns past folded_until, so all but the recent ones are folded into the summary on the way.
+def _migrate_memory_doc(db, memory_doc):
+    user_id = memory_doc["user_id"]
+    turns = memory_doc.get("memory") or []
+    base = time.time() - len(turns)
+    if turns:
+        try:
+            db.memory_turns.bulk_write([
+                UpdateOne(
+                    {"user_id": user_id, "legacy_seq": i},
+                    {"$setOnInsert": {"ts": base + i, "user": turn["user"], "assistant": turn["assistant"]}},
+                    upsert=True
+                )
+                for i, turn in enumerate(turns)
+            ], ordered=False)
+        except BulkWriteError as e:
+            # A concurrent migration of the same document inserting first is fine; anything else is not
+            if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+                raise
+
+    settings = conversation_memory.resolve_settings(memory_doc.get("settings"))
+    recent, summary = conversation_memory.fold(turns, memory_doc.get("summary", ""), settings)
+    folded = len(turns) - len(recent)
+    folded_until = 0
+    if folded:
+        # The stored timestamp, which an earlier interrupted attempt may have set
+        last_folded = db.memory_turns.find_one({"user_id": user_id, "legacy_seq": folded - 1}, {"ts": 1})
+        folded_until = last_folded["ts"]
+    removed = db.memory.update_one(
+        {"_id": memory_doc["_id"], "memory": {"$exists": True}},
+        {"$unset": {"memory": ""}, "$set": {"summary": summary, "folded_until": folded_until}}
+    )
+    return len(turns) if removed.modified_count == 1 else 0
+
+
+def migrate_memory_documents(mongodb_uri):
+    db = _get_db(mongodb_uri)
+    users = turns = 0
+    for memory_doc in db.memory.find({"memory": {"$exists": True}}):
+        turns += _migrate_memory_doc(db, memory_doc)
+        users += 1
+    print(f"Migrated {turns} turns for {users} users to memory_turns")
+    return users, turns
+
+
+# Function to load memory from MongoDB: the unfolded turn window, rolling summary and the user's memory settings
 def load_memory(user_id, mongodb_uri):
-    client = MongoClient(mongodb_uri)
-    db = client.Universe
-    collection = db.memory
-    memory_doc = collection.find_one({"user_id": user_id})
-    if memory_doc and "memory" in memory_doc:
-        return memory_doc["memory"]
-    return []
-
-# Function to save memory to MongoDB
+    db = _get_db(mongodb_uri)
+    memory_doc = db.memory.find_one({"user_id": user_id}) or {}
+    if "memory" in memory_doc:
+        _migrate_memory_doc(db, memory_doc)
+        memory_doc = db.memory.find_one({"user_id": user_id}) or {}
+
+    settings = conversation_memory.resolve_settings(memory_doc.get("settings"))
+    folded_until = memory_doc.get("folded_until", 0)
+
+    # Only the window the prompt needs, newest first off the (user_id, ts) index
+    cursor = db.memory_turns.find(
+        {"user_id": user_id, "ts": {"$gt": folded_until}},
+        {"_id": 0, "user": 1, "assistant": 1, "ts": 1}
+    ).sort("ts", -1).limit(settings["recent_turns"] + FOLD_BATCH)
+    turns = list(cursor)
+    turns.reverse()
+
+    return {
+        "turns": turns,
+        "summary": memory_doc.get("summary", ""),
+        "settings": settings,
+    }
+
+# Function to save memory to MongoDB: new turns are appended, and the summary is only rewritten once enough turns pile up
 def save_memory(user_id, memory, mongodb_uri):
-    client = MongoClient(mongodb_uri)
-    db = client.Universe
-    collection = db.memory
-    collection.update_one({"user_id": user_id}, {"$set": {"memory": memory}}, upsert=True)
+    db = _get_db(mongodb_uri)
+    new_turns = [turn for turn in memory["turns"] if "ts" not in turn]
+    for turn in new_turns:
+        turn["ts"] = time.time()
+    if new_turns:
+        db.memory_turns.insert_many([
+            {"user_id": user_id, "ts": turn["ts"], "user": turn["user"], "assistant": turn["assistant"]}
+            for turn in new_turns
+        ])
+
+    turns = memory["turns"]
+    keep = memory["settings"]["recent_turns"]
+    if len(turns) > keep + FOLD_BATCH:
+        recent, summary = conversation_memory.fold(turns, memory["summary"], memory["settings"])
+        folded = turns[:len(turns) - len(recent)]
+        db.memory.update_one(
+            {"user_id": user_id},
+            {"$set": {"summary": summary, "folded_until": folded[-1]["ts"]}},
+            upsert=True
+        )
+
+def load_memory_settings(user_id, mongodb_uri):
+    db = _get_db(mongodb_uri)
+    memory_doc = db.memory.find_one({"user_id": user_id}, {"settings": 1}) or {}
+    return conversation_memory.resolve_settings(memory_doc.get("settings"))
+
+def save_memory_settings(user_id, settings, mongodb_uri):
+    settings = conversation_memory.validate_settings(settings)
+    db = _get_db(mongodb_uri)
+    db.memory.update_one(
+        {"user_id": user_id},
+        {"$set": {f"settings.{key}": value for key, value in settings.items()}},
+        upsert=True
+    )
+    return load_memory_settings(user_id, mongodb_uri)
 
 def delete_memory(user_id, mongodb_uri):
-    client = None
     try:
-        client = MongoClient(mongodb_uri)
-        db = client.Universe
-        collection = db.memory
-        
-        # Delete and get result
-        result = collection.delete_one({"user_id": user_id})
-        
+        db = _get_db(mongodb_uri)
+
+        # Delete the turn records and the summary document
+        turns_result = db.memory_turns.delete_many({"user_id": user_id})
+        result = db.memory.delete_one({"user_id": user_id})
+
         # Return True if something was deleted, False otherwise
-        return result.deleted_count > 0
-        
+        return result.deleted_count > 0 or turns_result.deleted_count > 0
+
     except Exception as e:
         print(f"Database error: {e}")
         raise
+
+# Time-to-first-token and total latency of streamed answers, tracked separately
+_stream_stats = {
+    "streams": 0,
+    "ttfb_ms_total": 0.0,
+    "total_ms_total": 0.0,
+    "last_ttfb_ms": None,
+    "last_total_ms": None,
+}
+_stream_stats_lock = Lock()
+
+
+def _record_stream(ttfb_ms, total_ms):
+    with _stream_stats_lock:
+        _stream_stats["streams"] += 1
+        _stream_stats["ttfb_ms_total"] += ttfb_ms
+        _stream_stats["total_ms_total"] += total_ms
+        _stream_stats["last_ttfb_ms"] = round(ttfb_ms, 2)
+        _stream_stats["last_total_ms"] = round(total_ms, 2)
+
+
+def stream_stats():
+    with _stream_stats_lock:
+        stats = dict(_stream_stats)
+    count = stats.pop("streams")
+    ttfb_total = stats.pop("ttfb_ms_total")
+    total_total = stats.pop("total_ms_total")
+    stats["streams"] = count
+    stats["avg_ttfb_ms"] = round(ttfb_total / count, 2) if count else None
+    stats["avg_total_ms"] = round(total_total / count, 2) if count else None
+    return stats
+
+
+def format_response(generated_text, unique_sources):
+    return f"Response: {generated_text}\nSources: {unique_sources if unique_sources else 'No sources found.'}"
+
+
+def _scoped_collections(user_id, courses):
+    return [owner_collection_name(user_id)] + [course_collection_name(course) for course in courses or []]
+
+
+_legacy_checked = set()  # users whose pre-owner-collection chunks have been looked for in this process
+_legacy_checked_lock = Lock()
+
+
+def _ensure_owner_collection(user_id):
+    # Users who uploaded before per-owner collections existed get their own uploads re-ingested on first
+    # use (in the background); the shared default collection (every user's chunks mixed together) is never searched
+    with _legacy_checked_lock:
+        if user_id in _legacy_checked:
+            return
+    from langchain_loader import migrate_legacy_documents
+
+    try:
+        migrate_legacy_documents(user_id)
+    except Exception as e:
+        print(f"Error migrating legacy chunks for {user_id}: {e}")
+        return
+    with _legacy_checked_lock:
+        _legacy_checked.add(user_id)
+
+
+def _vector_search(query_text, k, collections):
+    results = []
+    for collection_name in collections:
+        db = get_vector_store(CHROMA_PATH, collection_name)
+        results.extend(db.similarity_search_with_relevance_scores(query_text, k=k))
+
+    results.sort(key=lambda result: result[1], reverse=True)
+    return results[:k]
+
+
+def _lexical_search(query_text, k, collections):
+    results = []
+    for collection_name in collections:
+        results.extend(get_lexical_index(CHROMA_PATH, collection_name).search(query_text, k=k))
+    results.sort(key=lambda result: result[1], reverse=True)
+    return results[:k]
+
+
+# Hybrid retrieval: MiniLM similarity and BM25 over exact terms, fused by reciprocal rank.
+# Returns fused order with each hit's vector relevance (None for lexical-only hits).
+def _retrieve(query_text, k, collections):
+    vector_results = _vector_search(query_text, RETRIEVAL_CANDIDATES, collections)
+    lexical_results = _lexical_search(query_text, RETRIEVAL_CANDIDATES, collections)
+    if not lexical_results:
+        return vector_results[:k]
+    relevance = {chunk_key(doc): score for doc, score in vector_results}
+    fused = reciprocal_rank_fusion(vector_results, lexical_results, k=k)
+    return [(doc, relevance.get(chunk_key(doc))) for doc, _score in fused]
+
+
+# An answer's memory load runs on this pool while its query is embedded
+_stage_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="answer-stage")
+# Memory writes and answer-cache fills happen after the response, in per-user order
+_memory_writer = ThreadPoolExecutor(max_workers=4, thread_name_prefix="memory-writer")
+_pending_writes = {}  # user_id -> Future of that user's latest write-behind
+_pending_writes_lock = Lock()
+# A user's next question waits at most this long for their previous turn to be saved
+PENDING_WRITE_WAIT_SECONDS = 5
+
+_stage_stats = {}  # stage -> [count, total_ms]
+_stage_stats_lock = Lock()
+
+
+def _timed(timings, stage, fn, *args):
+    start = time.perf_counter()
+    try:
+        return fn(*args)
     finally:
-        if client:
-            client.close()
+        timings[stage] = round((time.perf_counter() - start) * 1000, 2)
+
+
+def _record_timings(timings):
+    with _stage_stats_lock:
+        for stage, ms in timings.items():
+            entry = _stage_stats.setdefault(stage, [0, 0.0])
+            entry[0] += 1
+            entry[1] += ms
+    print(f"Answer stage timings (ms): {timings}")
+
+
+def stage_stats():
+    with _stage_stats_lock:
+        return {stage: {"count": count, "avg_ms": round(total / count, 2)} for stage, (count, total) in _stage_stats.items()}
+
+
+def _run_after(previous, fn, *args):
+    # Writes for one user are chained so turn N is always stored before turn N+1
+    if previous is not None:
+        try:
+            previous.result()
+        except Exception:
+            pass
+    try:
+        fn(*args)
+    except Exception as e:
+        print(f"Error in memory write-behind: {e}")
 
-def get_answer(user_id, query, mongodb_uri, k=10):
-    # Load persistent memory from MongoDB
-    memory = load_memory(user_id, mongodb_uri)
 
-    query_text = query
+def _write_behind(user_id, fn, *args):
+    with _pending_writes_lock:
+        future = _memory_writer.submit(_run_after, _pending_writes.get(user_id), fn, *args)
+        _pending_writes[user_id] = future
 
-    # Prepare embeddings and Chroma database
-    embedding_function = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L12-v2")
-    db = Chroma(persist_directory=CHROMA_PATH, embedding_function=embedding_function)
+    def _clear(done):
+        with _pending_writes_lock:
+            if _pending_writes.get(user_id) is done:
+                del _pending_writes[user_id]
 
-    # Search for similar contexts
-    results = db.similarity_search_with_relevance_scores(query_text, k=k)
+    future.add_done_callback(_clear)
+
+
+def _load_memory_after_pending_write(user_id, mongodb_uri):
+    with _pending_writes_lock:
+        pending = _pending_writes.get(user_id)
+    if pending is not None:
+        wait([pending], timeout=PENDING_WRITE_WAIT_SECONDS)
+    return load_memory(user_id, mongodb_uri)
+
+
+# Everything up to the LLM call: memory, answer cache, retrieval and prompt. Stage times go into timings,
+# which the caller records whether or not an answer comes out.
+# Memory load runs alongside query embedding; retrieval only runs once the answer cache has missed.
+def _prepare_answer(user_id, query_text, mongodb_uri, k, courses, timings):
+    state = {"user_id": user_id, "query": query_text, "mongodb_uri": mongodb_uri, "timings": timings}
+    memory_future = _stage_executor.submit(_timed, timings, "memory_load", _load_memory_after_pending_write, user_id, mongodb_uri)
+
+    # Search for similar contexts in the user's own and opted-in course collections only.
+    _ensure_owner_collection(user_id)
+    collections = _scoped_collections(user_id, courses)
+
+    # Answers are only reusable for standalone questions against the same corpus version
+    state["cache_scope"] = (CHROMA_PATH, tuple((name, get_store_version(CHROMA_PATH, name)) for name in collections))
+    state["query_vector"] = _timed(timings, "embed_query", get_embeddings().embed_query, query_text)
+
+    memory = memory_future.result()
+    state["memory"] = memory
+    if answer_cache.depends_on_history(query_text, memory["turns"] or memory["summary"]):
+        answer_cache.record_skip()
+        state["query_vector"] = None
+    else:
+        cached = answer_cache.lookup(state["cache_scope"], state["query_vector"])
+        if cached is not None:
+            state["cached"] = cached
+            return state
+
+    results = _timed(timings, "retrieval", _retrieve, query_text, k, collections)
     if not results:
-        return f"Unable to find matching results"
+        state["error"] = f"Unable to find matching results"
+        return state
+
+    # De-duplicate, stitch neighbouring chunks and pack to the context token budget
+    context_docs, context_text = _timed(timings, "pack_context", pack_context, results)
+    state["context_docs"] = context_docs
 
-    # Combine context from search results
-    context_text = "\n\n---\n\n".join([doc.page_content for doc, _score in results])
-    
-    # Add conversation history to the prompt
-    conversation_history = "\n".join([f"User: {entry['user']}\nAssistant: {entry['assistant']}" for entry in memory])
+    # Add conversation history to the prompt: recent turns verbatim, older ones summarised, capped in size
+    conversation_history = conversation_memory.build_history(memory["turns"], memory["summary"], memory["settings"])
     prompt_template = ChatPromptTemplate.from_template(PROMPT_TEMPLATE)
     prompt = prompt_template.format(context=context_text, history=conversation_history, question=query_text)
+    conversation_memory.record_prompt(conversation_history, prompt)
     print("Prompt generated for the query:")
     print(prompt)
 
-    # Call the Hugging Face inference client
-    client = InferenceClient(api_key=os.getenv("HUGGINGFACE_API"))
-
-    messages = [
+    state["messages"] = [
         {
             "role": "user",
             "content": prompt
         }
     ]
+    return state
 
-    try:
-        completion = client.chat.completions.create(
-            model="meta-llama/Llama-3.2-3B-Instruct",  
-            messages=messages,
-            max_tokens=300
-        )
-
-        # Extract generated text
-        generated_text = completion.choices[0].message["content"].strip()
-    except Exception as e:
-        return f"Error calling the inference API: {e}"
 
-    # Extract and deduplicate sources
-    sources = [doc.metadata.get("source", None) for doc, _score in results]
-    sources = [src for src in sources if src]
-    unique_sources = list(dict.fromkeys(sources))
+def _persist_turn(state, generated_text, unique_sources):
+    if "cached" not in state and state["query_vector"] is not None:
+        answer_cache.store(state["cache_scope"], state["query_vector"], (generated_text, unique_sources))
 
     # Save the current interaction to memory in MongoDB
-    memory.append({"user": query_text, "assistant": generated_text})
-    save_memory(user_id, memory, mongodb_uri)  # Persist updated memory
+    memory = state["memory"]
+    memory["turns"].append({"user": state["query"], "assistant": generated_text})
+    save_memory(state["user_id"], memory, state["mongodb_uri"])  # Persist updated memory
+
+
+# Everything after the LLM call: sources now, answer cache and memory save in the background
+def _finish_answer(state, generated_text):
+    if "cached" in state:
+        unique_sources = state["cached"][1]
+    else:
+        # Extract and deduplicate sources
+        sources = [doc.metadata.get("source", None) for doc in state["context_docs"]]
+        sources = [src for src in sources if src]
+        unique_sources = list(dict.fromkeys(sources))
+
+    _write_behind(state["user_id"], _persist_turn, state, generated_text, unique_sources)
+    return unique_sources
+
+
+def get_answer(user_id, query, mongodb_uri, k=6, courses=None):
+    timings = {}
+    try:
+        state = _prepare_answer(user_id, query, mongodb_uri, k, courses, timings)
+        if "error" in state:
+            return state["error"]
+
+        if "cached" in state:
+            generated_text = state["cached"][0]
+        else:
+            # Call the model through the shared gateway (pooled, retried, deadline-bounded)
+            try:
+                generated_text = _timed(timings, "llm", get_llm().complete, state["messages"], 300)
+            except Exception as e:
+                return f"Error calling the inference API: {e}"
+
+        unique_sources = _finish_answer(state, generated_text)
+    finally:
+        _record_timings(timings)
 
     # Format and print the response
-    formatted_response = f"Response: {generated_text}\nSources: {unique_sources if unique_sources else 'No sources found.'}"
+    formatted_response = format_response(generated_text, unique_sources)
     print(formatted_response)
-    return formatted_response
\ No newline at end of file
+    return formatted_response
+
+
+# Same pipeline as get_answer, but yields tokens as the model produces them.
+# Events: {"event": "token", "token"}, then {"event": "done", "answer", "sources", ...} or {"event": "error", "message"}
+def stream_answer(user_id, query, mongodb_uri, k=6, courses=None):
+    start = time.perf_counter()
+    first_token_at = None
+    timings = {}
+
+    try:
+        state = _prepare_answer(user_id, query, mongodb_uri, k, courses, timings)
+        if "error" in state:
+            yield {"event": "error", "message": state["error"]}
+            return
+
+        if "cached" in state:
+            generated_text = state["cached"][0]
+            first_token_at = time.perf_counter()
+            yield {"event": "token", "token": generated_text}
+        else:
+            parts = []
+            llm_start = time.perf_counter()
+            try:
+                for token in get_llm().stream(state["messages"], max_tokens=300):
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                    parts.append(token)
+                    yield {"event": "token", "token": token}
+            except Exception as e:
+                yield {"event": "error", "message": f"Error calling the inference API: {e}"}
+                return
+            finally:
+                timings["llm"] = round((time.perf_counter() - llm_start) * 1000, 2)
+            generated_text = "".join(parts).strip()
+
+        # Sources go out after the last token; the memory write happens in the background
+        unique_sources = _finish_answer(state, generated_text)
+    finally:
+        _record_timings(timings)
+
+    end = time.perf_counter()
+    ttfb_ms = ((first_token_at or end) - start) * 1000
+    total_ms = (end - start) * 1000
+    _record_stream(ttfb_ms, total_ms)
+    yield {
+        "event": "done",
+        "answer": generated_text,
+        "sources": unique_sources,
+        "ttfb_ms": round(ttfb_ms, 2),
+        "total_ms": round(total_ms, 2),
+        "timings": timings,
+    }
+
+
+if __name__ == "__main__":
+    import sys
+
+    # MONGO_URI=... python query_data.py migrate-memory : move legacy memory arrays into memory_turns
+    if sys.argv[1:] == ["migrate-memory"]:
+        mongodb_uri = os.getenv("MONGO_URI")
+        if not mongodb_uri:
+            sys.exit("Set MONGO_URI to the connection string of the Universe database")
+        migrate_memory_documents(mongodb_uri)
@@ -0,0 +1,337 @@
+import os
+import time
+from bisect import bisect_left, insort
+from threading import Lock
+
+# Seconds a question is open for answers, and how long its answer is shown before the next one
+QUESTION_SECONDS = float(os.getenv("QUIZ_QUESTION_SECONDS", "10"))
+REVEAL_SECONDS = float(os.getenv("QUIZ_REVEAL_SECONDS", "5"))
+# A correct answer earns MAX_POINTS when instant, falling linearly to MIN_POINTS_SHARE of it at the deadline
+MAX_POINTS = 1000
+MIN_POINTS_SHARE = 0.5
+# Leaderboard entries sent with every round's delta
+LEADERBOARD_TOP = 10
+# Answer counts are broadcast at most this often per room while a question is open
+PROGRESS_INTERVAL = 0.25
+
+# Game states
+QUESTION = "question"  # a question is open for answers
+REVEAL = "reveal"  # the answer and leaderboard changes are being shown
+FINISHED = "finished"
+
+_games = {}  # room code -> QuizGame
+_games_lock = Lock()
+_stats_lock = Lock()
+_stats = {
+    "games_started": 0,
+    "games_finished": 0,
+    "rounds": 0,
+    "submissions": 0,
+    "rejected": 0,
+    "submit_seconds_total": 0.0,
+    "round_end_seconds_total": 0.0,
+}
+
+
+def _record(**increments):
+    with _stats_lock:
+        for name, value in increments.items():
+            _stats[name] += value
+
+
+def public_question(question):
+    # What players see while a question is open: no answer
+    return {"question": question["question"], "options": question["options"]}
+
+
+def _normalise_question(question):
+    options = list(question["options"])
+    answer_index = question.get("answer_index")
+    if answer_index is None:
+        answer_index = options.index(question["answer"]) if question.get("answer") in options else -1
+    return {
+        "question": question["question"],
+        "options": options,
+        "answer_index": answer_index,
+        "answer": options[answer_index] if 0 <= answer_index < len(options) else question.get("answer"),
+        "option_index": {option: i for i, option in enumerate(options)},
+    }
+
+
+class Leaderboard:
+    # Scores by player, plus the players ordered by (score desc, name) in a list kept sorted with bisect,
+    # so ranks and the top of the table are read without sorting the room
+
+    def __init__(self):
+        self._scores = {}
+        self._order = []  # (-score, username), ascending
+
+    def __len__(self):
+        return len(self._scores)
+
+    def __contains__(self, username):
+        return username in self._scores
+
+    def add(self, username):
+        if username not in self._scores:
+            self._scores[username] = 0
+            insort(self._order, (0, username))
+
+    def score(self, username):
+        return self._scores[username]
+
+    def rank(self, username):
+        return bisect_left(self._order, (-self._scores[username], username)) + 1
+
+    def apply(self, gains):
+        # gains maps username -> points won this round; when most of the room scored, one sort is
+        # cheaper than moving each entry
+        resort = len(gains) > len(self._order) // 8
+        for username, points in gains.items():
+            old = self._scores[username]
+            self._scores[username] = old + points
+            if not resort:
+                del self._order[bisect_left(self._order, (-old, username))]
+                insort(self._order, (-(old + points), username))
+        if resort:
+            self._order = sorted((-score, username) for username, score in self._scores.items())
+
+    def top(self, count=None):
+        entries = self._order if count is None else self._order[:count]
+        return [{"username": username, "score": -score, "rank": i + 1} for i, (score, username) in enumerate(entries)]
+
+
+class QuizGame:
+    # Server-side state machine of one room's game: QUESTION -> REVEAL -> QUESTION ... -> FINISHED.
+    # The server's clock opens and closes each question, so scores do not depend on browser timers.
+    # emit(event, payload) broadcasts to the room; schedule(delay, fn) runs fn after delay seconds on
+    # another thread (never inline, as it is called with the game's lock held).
+    # Stale timers (a round that already ended early) are ignored through the round counter.
+
+    def __init__(self, room_code, questions, players, emit, schedule, on_finish=None,
+                 question_seconds=QUESTION_SECONDS, reveal_seconds=REVEAL_SECONDS, clock=time.monotonic):
+        self.room_code = room_code
+        self.questions = [_normalise_question(q) for q in questions]
+        self.leaderboard = Leaderboard()
+        for username in players:
+            self.leaderboard.add(username)
+        self.question_seconds = question_seconds
+        self.reveal_seconds = reveal_seconds
+        self._emit = emit
+        self._schedule = schedule
+        self._on_finish = on_finish
+        self._clock = clock
+        self._lock = Lock()
+
+        self.state = None
+        self.index = -1
+        self._round = 0  # bumped on every transition; timers carry the value they were set for
+        self._answers = {}  # username -> (option index, seconds taken) for the open question
+        self._started_at = 0.0
+        self._ends_at_ms = 0
+        self._last_progress = 0.0
+
+    def _send(self, events):
+        for event, payload in events:
+            self._emit(event, payload)
+
+    def start(self):
+        with self._lock:
+            events = self._start_round(0)
+        self._send(events)
+
+    def _start_round(self, index):
+        self.index = index
+        self._round += 1
+        self.state = QUESTION
+        self._answers = {}
+        self._started_at = self._clock()
+        self._last_progress = self._started_at
+        self._ends_at_ms = int((time.time() + self.question_seconds) * 1000)
+        token = self._round
+        self._schedule(self.question_seconds, lambda: self._end_round(token))
+        return [("round_started", dict(
+            public_question(self.questions[index]),
+            questionIndex=index,
+            totalQuestions=len(self.questions),
+            duration=self.question_seconds,
+            endsAt=self._ends_at_ms,
+        ))]
+
+    def add_player(self, username):
+        # Players join through the room; submit() turns away anyone who has not
+        with self._lock:
+            self.leaderboard.add(username)
+
+    def add_questions(self, questions):
+        # Questions generated after the game started are played once the earlier ones are done
+        with self._lock:
+            if self.state != FINISHED:
+                self.questions.extend(_normalise_question(q) for q in questions)
+
+    def submit(self, username, question_index, answer=None, answer_index=None):
+        # Records one answer for the open question; constant time, scoring happens when the round ends
+        started = time.perf_counter()
+        now = self._clock()
+        end_now = False
+        events = []
+        with self._lock:
+            if username not in self.leaderboard:
+                result = {"accepted": False, "reason": "Not a player in this game"}
+            elif self.state != QUESTION or question_index != self.index:
+                result = {"accepted": False, "reason": "Question is closed"}
+            elif username in self._answers:
+                result = {"accepted": False, "reason": "Already answered"}
+            elif now - self._started_at > self.question_seconds:
+                result = {"accepted": False, "reason": "Time is up"}
+            else:
+                question = self.questions[self.index]
+                if not isinstance(answer_index, int) or not 0 <= answer_index < len(question["options"]):
+                    answer_index = question["option_index"].get(answer)
+                if answer_index is None:
+                    result = {"accepted": False, "reason": "Unknown option"}
+                else:
+                    self._answers[username] = (answer_index, now - self._started_at)
+                    result = {"accepted": True}
+                    end_now = len(self._answers) >= len(self.leaderboard)
+                    if end_now or now - self._last_progress >= PROGRESS_INTERVAL:
+                        self._last_progress = now
+                        events.append(("round_progress", {
+                            "questionIndex": self.index,
+                            "answered": len(self._answers),
+                            "players": len(self.leaderboard),
+                        }))
+            result["questionIndex"] = question_index
+            token = self._round
+        self._send(events)
+        if end_now:
+            # Everyone has answered; no need to wait for the timer
+            self._end_round(token)
+        _record(submissions=1, rejected=0 if result["accepted"] else 1,
+                submit_seconds_total=time.perf_counter() - started)
+        return result
+
+    def _points(self, seconds):
+        share = 1 - (1 - MIN_POINTS_SHARE) * min(seconds / self.question_seconds, 1)
+        return int(round(MAX_POINTS * share))
+
+    def _end_round(self, token):
+        started = time.perf_counter()
+        with self._lock:
+            if self.state != QUESTION or token != self._round:
+                return
+            self._round += 1
+            self.state = REVEAL
+            question = self.questions[self.index]
+            gains = {
+                username: self._points(seconds)
+                for username, (choice, seconds) in self._answers.items() if choice == question["answer_index"]
+            }
+            self.leaderboard.apply(gains)
+            # Only the new scores of players who scored are sent (username -> score); clients keep the
+            # full table and re-rank it, and get the exact top of it alongside
+            changes = {username: self.leaderboard.score(username) for username in gains}
+            events = [
+                ("round_ended", {
+                    "questionIndex": self.index,
+                    "answer": question["answer"],
+                    "answerIndex": question["answer_index"],
+                    "answered": len(self._answers),
+                    "correct": len(gains),
+                    "players": len(self.leaderboard),
+                }),
+                ("leaderboard_delta", {
+                    "questionIndex": self.index,
+                    "changes": changes,
+                    "top": self.leaderboard.top(LEADERBOARD_TOP),
+                    "players": len(self.leaderboard),
+                }),
+            ]
+            next_token = self._round
+            self._schedule(self.reveal_seconds, lambda: self._next_round(next_token))
+        self._send(events)
+        _record(rounds=1, round_end_seconds_total=time.perf_counter() - started)
+
+    def _next_round(self, token):
+        finished = False
+        with self._lock:
+            if self.state != REVEAL or token != self._round:
+                return
+            if self.index + 1 < len(self.questions):
+                events = self._start_round(self.index + 1)
+            else:
+                self._round += 1
+                self.state = FINISHED
+                finished = True
+                events = [("game_over", {"leaderboard": self.leaderboard.top(), "questions": len(self.questions)})]
+        self._send(events)
+        if finished:
+            _record(games_finished=1)
+            if self._on_finish:
+                self._on_finish(self)
+
+    def stop(self):
+        # Ends the game without results, e.g. when everyone left the room
+        with self._lock:
+            self._round += 1
+            self.state = FINISHED
+
+    def snapshot(self, username=None):
+        # Current state for a player (re)joining mid-game
+        with self._lock:
+            state = {
+                "state": self.state,
+                "questionIndex": self.index,
+                "totalQuestions": len(self.questions),
+                "leaderboard": self.leaderboard.top(LEADERBOARD_TOP),
+                "players": len(self.leaderboard),
+            }
+            if self.state == QUESTION:
+                state.update(public_question(self.questions[self.index]), endsAt=self._ends_at_ms,
+                             answered=username in self._answers)
+            if username in self.leaderboard:
+                state["you"] = {"score": self.leaderboard.score(username), "rank": self.leaderboard.rank(username)}
+        return state
+
+
+def start_game(room_code, questions, players, emit, schedule, on_finish=None, **kwargs):
+    def finished(game):
+        with _games_lock:
+            if _games.get(room_code) is game:
+                del _games[room_code]
+        if on_finish:
+            on_finish(game)
+
+    game = QuizGame(room_code, questions, players, emit, schedule, on_finish=finished, **kwargs)
+    with _games_lock:
+        previous = _games.get(room_code)
+        _games[room_code] = game
+    if previous:
+        previous.stop()
+    _record(games_started=1)
+    game.start()
+    return game
+
+
+def get_game(room_code):
+    with _games_lock:
+        return _games.get(room_code)
+
+
+def end_game(room_code):
+    with _games_lock:
+        game = _games.pop(room_code, None)
+    if game:
+        game.stop()
+
+
+def game_stats():
+    with _stats_lock:
+        stats = dict(_stats)
+    with _games_lock:
+        stats["active_games"] = len(_games)
+    submit_total = stats.pop("submit_seconds_total")
+    round_end_total = stats.pop("round_end_seconds_total")
+    stats["submit_us_mean"] = round(submit_total / stats["submissions"] * 1e6, 1) if stats["submissions"] else None
+    stats["round_end_ms_mean"] = round(round_end_total / stats["rounds"] * 1000, 2) if stats["rounds"] else None
+    return stats
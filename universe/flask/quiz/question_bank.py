@@ -0,0 +1,181 @@
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+# Bank states, in order
+WAITING = "waiting"  # the quiz upload is still being ingested
+GENERATING = "generating"
+READY = "ready"
+FAILED = "failed"
+
+CHROMA_PATH = "universe/flask/chroma"
+QUESTION_BANK_SIZE = int(os.getenv("QUESTION_BANK_SIZE", "20"))
+QUESTION_BANK_WORKERS = int(os.getenv("QUESTION_BANK_WORKERS", "2"))
+
+_executor = ThreadPoolExecutor(max_workers=QUESTION_BANK_WORKERS, thread_name_prefix="question-bank")
+_banks = None
+_questions = None
+_listeners = []  # fn(bank summary, new questions) called as the bank grows
+
+
+def init_question_bank(banks_collection, questions_collection):
+    # Only binds the collections; the serving process resumes banks with recover_question_banks()
+    global _banks, _questions
+    _banks = banks_collection
+    _questions = questions_collection
+
+
+def recover_question_banks():
+    _executor.submit(_recover_banks, datetime.now())
+
+
+def _recover_banks(started_at):
+    try:
+        _banks.create_index([("owner", 1), ("created_at", -1)])
+        _questions.create_index([("bank_id", 1), ("seq", 1)], unique=True)
+        # Banks cut off mid-generation by a restart resume where they stopped; waiting banks are
+        # scheduled again by their (requeued) ingestion job
+        for bank in _banks.find({"state": GENERATING, "created_at": {"$lt": started_at}}):
+            print(f"Resuming question bank {bank['_id']}")
+            schedule_bank_build(bank["_id"])
+    except Exception as e:
+        print(f"Error recovering question banks: {e}")
+
+
+def add_progress_listener(fn):
+    _listeners.append(fn)
+
+
+def _notify(bank_id, new_questions=()):
+    summary = get_bank(bank_id)
+    for fn in _listeners:
+        try:
+            fn(summary, list(new_questions))
+        except Exception as e:
+            print(f"Error in question bank listener: {e}")
+
+
+def _set_state(bank_id, state, **fields):
+    fields.update({"state": state, "updated_at": datetime.now()})
+    _banks.update_one({"_id": bank_id}, {"$set": fields})
+
+
+def create_bank(owner, files, target=QUESTION_BANK_SIZE):
+    bank_id = uuid.uuid4().hex
+    now = datetime.now()
+    _banks.insert_one({
+        "_id": bank_id,
+        "owner": owner,
+        "files": files,
+        "state": WAITING,
+        "target": target,
+        "generated": 0,
+        "created_at": now,
+        "updated_at": now,
+    })
+    return bank_id
+
+
+def fail_bank(bank_id, error):
+    _set_state(bank_id, FAILED, error=error, finished_at=datetime.now())
+    _notify(bank_id)
+
+
+def schedule_bank_build(bank_id):
+    _executor.submit(_build_bank, bank_id)
+
+
+def _sampler(owner, files):
+    from quiz.quiz_sampler import QuizSampler
+    from vector_stores import get_vector_store
+
+    return QuizSampler.from_store(get_vector_store(CHROMA_PATH+f"_{owner}"), files)
+
+
+def _build_bank(bank_id):
+    from quiz.quiz_query_data import MCQ_BATCH_SIZE, generate_mcq_batch
+
+    bank = _banks.find_one({"_id": bank_id})
+    if not bank or bank["state"] in (READY, FAILED):
+        return
+    try:
+        # Resuming after a restart skips the chunks that already produced a question
+        existing = list(_questions.find({"bank_id": bank_id}))
+        seen_questions = [q["question"] for q in existing]
+        generated = len(seen_questions)
+        _set_state(bank_id, GENERATING, generated=generated, started_at=bank.get("started_at") or datetime.now())
+        _notify(bank_id)
+
+        # Contexts are drawn across topic clusters and files, never reusing (or overlapping) a chunk;
+        # several go to the model per call and questions are stored as they stream back
+        sampler = _sampler(bank["owner"], bank["files"])
+        sampler.mark_used(chunk for q in existing for chunk in q.get("source_chunk_ids", []))
+        while generated < bank["target"]:
+            batch = sampler.next_contexts(min(MCQ_BATCH_SIZE, bank["target"] - generated))
+            if not batch:
+                break
+            texts = [text for _ids, text, _source in batch]
+            for index, mcq in generate_mcq_batch(texts, seen_questions=seen_questions):
+                chunk_ids, _text, source = batch[index]
+                question = dict(mcq, bank_id=bank_id, seq=generated, source=source, source_chunk_ids=chunk_ids,
+                                created_at=datetime.now())
+                _questions.insert_one(question)
+                seen_questions.append(mcq["question"])
+                generated += 1
+                _banks.update_one({"_id": bank_id}, {"$set": {"generated": generated, "updated_at": datetime.now()}})
+                _notify(bank_id, [_public(question)])
+            _banks.update_one({"_id": bank_id}, {"$set": {"coverage": sampler.coverage()}})
+
+        if generated:
+            _set_state(bank_id, READY, generated=generated, finished_at=datetime.now())
+        else:
+            _set_state(bank_id, FAILED, error="No questions could be generated from the uploaded files",
+                       finished_at=datetime.now())
+        _notify(bank_id)
+    except Exception as e:
+        print(f"Question bank {bank_id} failed: {e}")
+        fail_bank(bank_id, str(e))
+
+
+def _public(question):
+    return {
+        "seq": question["seq"],
+        "question": question["question"],
+        "options": question["options"],
+        "answer_index": question["answer_index"],
+        "answer": question["answer"],
+    }
+
+
+def get_bank(bank_id):
+    bank = _banks.find_one({"_id": bank_id})
+    if not bank:
+        return None
+    return {
+        "bank_id": bank["_id"],
+        "owner": bank["owner"],
+        "files": bank.get("files", []),
+        "state": bank["state"],
+        "generated": bank.get("generated", 0),
+        "target": bank["target"],
+        "error": bank.get("error"),
+        "coverage": bank.get("coverage"),
+        "created_at": bank["created_at"].isoformat(),
+        "updated_at": bank["updated_at"].isoformat(),
+    }
+
+
+def find_bank(owner, files=None):
+    # The newest bank of this owner covering all the given files, or None if none does
+    query = {"owner": owner, "state": {"$ne": FAILED}}
+    if files:
+        query["files"] = {"$all": list(files)}
+    bank = _banks.find_one(query, {"_id": 1}, sort=[("created_at", -1)])
+    return bank["_id"] if bank else None
+
+
+def get_bank_questions(bank_id, since=0):
+    # Questions generated so far, in order; since skips the first n for clients polling a growing bank
+    cursor = _questions.find({"bank_id": bank_id, "seq": {"$gte": since}}).sort("seq", 1)
+    return [_public(question) for question in cursor]
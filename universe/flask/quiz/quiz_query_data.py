@@ -1,70 +1,251 @@
+import json
 import os
+import re
+import time
+from threading import Lock
 from pymongo import MongoClient
-from langchain_chroma import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
 from langchain.prompts import ChatPromptTemplate
-from huggingface_hub import InferenceClient
+from llm_gateway import get_llm
 from dotenv import load_dotenv
 
 load_dotenv()
 
-PROMPT_TEMPLATE = """
-You are a helpful assistant. Based on the context provided below, generate a multiple-choice question (MCQ) with four options.
+MCQ_BATCH_TEMPLATE = """
+You are a helpful assistant writing a multiple-choice quiz. Below are {count} numbered context passages.
+Write exactly one question for each passage, answerable from that passage alone.
 
-Context:
-{context}
+{contexts}
 
-Question:
-Generate an MCQ based on the context above with four options.
-
-Answer:
+Reply with only a JSON array of {count} objects, one per passage, in this form:
+[{{"source": <passage number>, "question": "...", "options": ["...", "...", "...", "..."], "answer_index": <0-3>}}]
 """
 
-def get_quiz_questions(query, user, k=10):
-    # Prepare embeddings and Chroma database
-    CHROMA_PATH = "universe/flask/chroma"+f"_{user}"
-    embedding_function = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L12-v2")
-    db = Chroma(persist_directory=CHROMA_PATH, embedding_function=embedding_function)
+# Contexts per LLM call when building a question bank
+MCQ_BATCH_SIZE = int(os.getenv("MCQ_BATCH_SIZE", "5"))
+MCQ_TOKENS_PER_QUESTION = 160
+# Contexts whose question came back malformed (or not at all) are retried this many times
+MCQ_MAX_RETRIES = int(os.getenv("MCQ_MAX_RETRIES", "1"))
+# Questions sharing at least this fraction of their words with an earlier one are dropped
+MCQ_DUPLICATE_OVERLAP = 0.8
+
+_OPTION_PREFIX_RE = re.compile(r"^\s*(?:[A-Da-d]|[1-4])[.):]\s+")
+_TRAILING_COMMA_RE = re.compile(r",\s*([}\]])")
+_WORD_RE = re.compile(r"[a-z0-9]+")
 
-    # Search for similar contexts
-    results = db.similarity_search_with_relevance_scores(query, k=k)
-    if not results:
-        return "Unable to find matching results."
+_mcq_stats_lock = Lock()
+_mcq_stats = {
+    "llm_calls": 0,
+    "questions": 0,
+    "malformed": 0,
+    "duplicates": 0,
+    "retried_contexts": 0,
+    "seconds_total": 0.0,
+}
 
-    # Combine context from search results
-    context_text = "\n\n---\n\n".join([doc.page_content for doc, _score in results])
 
-    # Create the prompt for generating MCQs
-    prompt_template = ChatPromptTemplate.from_template(PROMPT_TEMPLATE)
-    prompt = prompt_template.format(context=context_text)
+def _count(**deltas):
+    with _mcq_stats_lock:
+        for key, value in deltas.items():
+            _mcq_stats[key] += value
 
-    print("Prompt generated for the query:")
-    print(prompt)
 
-    # Call the Hugging Face inference client
-    client = InferenceClient(api_key=os.getenv("HUGGINGFACE_API"))
+def mcq_stats():
+    with _mcq_stats_lock:
+        stats = dict(_mcq_stats)
+    seconds = stats["seconds_total"]
+    stats["seconds_total"] = round(seconds, 3)
+    stats["questions_per_second"] = round(stats["questions"] / seconds, 3) if seconds else None
+    stats["questions_per_call"] = round(stats["questions"] / stats["llm_calls"], 2) if stats["llm_calls"] else None
+    stats["batch_size"] = MCQ_BATCH_SIZE
+    return stats
 
-    messages = [
-        {
-            "role": "user",
-            "content": prompt
-        }
-    ]
 
+def _loads_lenient(text):
+    try:
+        return json.loads(text)
+    except ValueError:
+        pass
+    # Common model slips: curly quotes and trailing commas
+    repaired = text.replace("\u201c", '"').replace("\u201d", '"')
+    repaired = _TRAILING_COMMA_RE.sub(r"\1", repaired)
     try:
-        completion = client.chat.completions.create(
-            model="meta-llama/Llama-3.2-3B-Instruct",  
-            messages=messages,
-            max_tokens=300
-        )
-
-        # Extract generated text
-        generated_text = completion.choices[0].message["content"].strip()
-        
-    except Exception as e:
-        return f"Error calling the inference API: {e}"
-
-    # Format and print the response
-    formatted_response = f"Generated MCQ:\n{generated_text}"
-    print(formatted_response)
-    return formatted_response
+        return json.loads(repaired)
+    except ValueError:
+        return None
+
+
+class JSONObjectStream:
+    # Incremental parser for a model reply: feed() it text as it streams in and it returns each
+    # top-level {...} object as soon as its closing brace arrives. Prose, code fences and the
+    # surrounding array are skipped; an object that does not parse comes back as None.
+
+    def __init__(self):
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._current = []
+
+    def feed(self, text):
+        objects = []
+        for ch in text:
+            if self._depth == 0:
+                if ch == "{":
+                    self._depth = 1
+                    self._current = [ch]
+                continue
+            self._current.append(ch)
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == "\\":
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch == "{":
+                self._depth += 1
+            elif ch == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    objects.append(_loads_lenient("".join(self._current)))
+                    self._current = []
+        return objects
+
+
+def validate_mcq(item, context_count):
+    # Normalises one parsed object to {"context", "question", "options", "answer_index", "answer"}
+    # (context is 0-based) or returns None if it is not a usable four-option question
+    if not isinstance(item, dict):
+        return None
+    question = item.get("question")
+    options = item.get("options")
+    if not isinstance(question, str) or not question.strip():
+        return None
+    if not isinstance(options, list) or len(options) != 4 or not all(isinstance(o, str) for o in options):
+        return None
+    options = [_OPTION_PREFIX_RE.sub("", o).strip() for o in options]
+    if not all(options) or len({o.lower() for o in options}) != 4:
+        return None
+
+    answer_index = item.get("answer_index")
+    if isinstance(answer_index, str) and answer_index.strip().isdigit():
+        answer_index = int(answer_index.strip())
+    if not isinstance(answer_index, int) or isinstance(answer_index, bool):
+        # Fall back to an answer given as text or as a letter
+        answer = item.get("answer")
+        answer_index = None
+        if isinstance(answer, str):
+            answer = _OPTION_PREFIX_RE.sub("", answer).strip()
+            if answer in options:
+                answer_index = options.index(answer)
+            elif answer.upper() in ("A", "B", "C", "D"):
+                answer_index = "ABCD".index(answer.upper())
+    if answer_index not in (0, 1, 2, 3):
+        return None
+
+    source = item.get("source", 1 if context_count == 1 else None)
+    if isinstance(source, str) and source.strip().strip("[]").isdigit():
+        source = int(source.strip().strip("[]"))
+    if not isinstance(source, int) or isinstance(source, bool) or not 1 <= source <= context_count:
+        return None
+
+    return {
+        "context": source - 1,
+        "question": question.strip(),
+        "options": options,
+        "answer_index": answer_index,
+        "answer": options[answer_index],
+    }
+
+
+def _question_words(question):
+    return set(_WORD_RE.findall(question.lower()))
+
+
+def is_duplicate(question, seen_words):
+    words = _question_words(question)
+    for other in seen_words:
+        union = words | other
+        if union and len(words & other) / len(union) >= MCQ_DUPLICATE_OVERLAP:
+            return True
+    return False
+
+
+def _batch_prompt(texts):
+    passages = "\n\n".join(f"[{i}] {text}" for i, text in enumerate(texts, start=1))
+    return ChatPromptTemplate.from_template(MCQ_BATCH_TEMPLATE).format(count=len(texts), contexts=passages)
+
+
+def generate_mcq_batch(contexts, seen_questions=(), max_retries=MCQ_MAX_RETRIES):
+    # Yields (context index, mcq) as each valid question streams in, one LLM call per batch of contexts.
+    # Contexts left without a valid, non-duplicate question are retried on their own; seen_questions
+    # are earlier questions (e.g. the rest of the bank) that new ones must not repeat.
+    seen_words = [_question_words(q) for q in seen_questions]
+    pending = list(range(len(contexts)))
+    attempt = 0
+    while pending and attempt <= max_retries:
+        if attempt:
+            _count(retried_contexts=len(pending))
+        start = time.monotonic()
+        answered = set()
+        parser = JSONObjectStream()
+        messages = [{"role": "user", "content": _batch_prompt([contexts[i] for i in pending])}]
+        _count(llm_calls=1)
+        try:
+            for token in get_llm().stream(messages, max_tokens=MCQ_TOKENS_PER_QUESTION * len(pending)):
+                for item in parser.feed(token):
+                    mcq = validate_mcq(item, len(pending))
+                    if mcq is None:
+                        _count(malformed=1)
+                        continue
+                    index = pending[mcq.pop("context")]
+                    if index in answered:
+                        continue
+                    if is_duplicate(mcq["question"], seen_words):
+                        _count(duplicates=1)
+                        continue
+                    answered.add(index)
+                    seen_words.append(_question_words(mcq["question"]))
+                    _count(questions=1)
+                    yield index, mcq
+        except Exception as e:
+            print(f"Error generating MCQ batch: {e}")
+        finally:
+            _count(seconds_total=time.monotonic() - start)
+        pending = [i for i in pending if i not in answered]
+        attempt += 1
+
+
+def get_quiz_questions(query, user, count=MCQ_BATCH_SIZE, quiz_id=None):
+    # Up to count structured MCQs about query from one batched LLM call; each one carries the chunks it came from.
+    # Calls with the same quiz_id share a sampler, so a quiz's questions spread over topics and files instead
+    # of returning the same top hits, and no chunk is reused until the quiz has been through them all.
+    # Without a quiz_id every call samples the store afresh.
+    from embeddings import get_embeddings
+    from quiz.quiz_sampler import QuizSampler, get_sampler
+    from vector_stores import get_vector_store
+
+    store_path = "universe/flask/chroma"+f"_{user}"
+    if quiz_id is None:
+        sampler = QuizSampler.from_store(get_vector_store(store_path))
+    else:
+        sampler = get_sampler(store_path, quiz_id)
+    query_vector = get_embeddings().embed_query(query)
+    used_before = sampler.coverage()["chunks_used"]
+    contexts = sampler.next_contexts(count, query_vector=query_vector)
+    if len(contexts) < count and used_before:
+        # The quiz has used every chunk; start another pass rather than run dry
+        sampler.reset()
+        sampler.mark_used([chunk_id for chunk_ids, _text, _source in contexts for chunk_id in chunk_ids])
+        contexts += sampler.next_contexts(count - len(contexts), query_vector=query_vector)
+    if not contexts:
+        return []
+
+    questions = []
+    for index, mcq in generate_mcq_batch([text for _ids, text, _source in contexts]):
+        chunk_ids, _text, source = contexts[index]
+        mcq["source_chunk_ids"] = chunk_ids
+        mcq["source"] = source
+        questions.append(mcq)
+    return questions
@@ -0,0 +1,219 @@
+import os
+from collections import OrderedDict
+from threading import Lock
+
+import numpy as np
+
+# Clusters of chunk embeddings the quiz draws from; roughly one per sqrt(chunks), within these bounds
+MIN_CLUSTERS = 2
+MAX_CLUSTERS = int(os.getenv("QUIZ_SAMPLER_MAX_CLUSTERS", "24"))
+KMEANS_ITERATIONS = 25
+# A context is a chunk plus the chunks that follow it in the same file, up to about this many characters
+QUESTION_CONTEXT_CHARS = int(os.getenv("QUESTION_CONTEXT_CHARS", "1200"))
+# Samplers of quizzes in progress, so a quiz's repeated get_quiz_questions calls keep drawing fresh chunks
+MAX_SAMPLERS = 64
+
+_samplers = OrderedDict()  # (store path, quiz id) -> (store version, QuizSampler)
+_samplers_lock = Lock()
+
+
+def _normalise(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def kmeans(vectors, k, iterations=KMEANS_ITERATIONS, seed=0):
+    # Spherical k-means with k-means++ seeding over unit vectors; returns (labels, centroids)
+    rng = np.random.default_rng(seed)
+    n = len(vectors)
+    first = rng.integers(n)
+    centroids = [vectors[first]]
+    distance = 1.0 - vectors @ vectors[first]
+    for _ in range(1, k):
+        total = distance.clip(min=0).sum()
+        index = rng.choice(n, p=distance.clip(min=0) / total) if total > 0 else rng.integers(n)
+        centroids.append(vectors[index])
+        distance = np.minimum(distance, 1.0 - vectors @ vectors[index])
+    centroids = np.array(centroids)
+
+    labels = np.argmax(vectors @ centroids.T, axis=1)
+    for _ in range(iterations):
+        updated = centroids.copy()
+        for j in range(k):
+            members = vectors[labels == j]
+            if len(members):
+                updated[j] = members.mean(axis=0)
+        updated = _normalise(updated)
+        new_labels = np.argmax(vectors @ updated.T, axis=1)
+        centroids = updated
+        if np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+    return labels, centroids
+
+
+class QuizSampler:
+    # Hands out question contexts that spread over the topics (embedding clusters) and files of a quiz
+    # store. Every chunk is used at most once, and a used chunk's neighbours (which share overlap text
+    # with it) are never handed out, so each generation call sees fresh, non-overlapping material.
+
+    def __init__(self, ids, documents, metadatas, embeddings, context_chars=QUESTION_CONTEXT_CHARS):
+        self.context_chars = context_chars
+        self._lock = Lock()
+        count = len(ids)
+        self.ids = list(ids)
+        self.documents = list(documents)
+        self.metadatas = [m or {} for m in metadatas]
+        self.sources = [m.get("source", "") for m in self.metadatas]
+
+        # Position of each chunk within its file, for neighbour lookups and in-order context building
+        self._by_source = {}
+        for i in sorted(range(count), key=lambda i: (self.sources[i], self._order_key(i))):
+            self._by_source.setdefault(self.sources[i], []).append(i)
+        self._position = {}
+        for chunks in self._by_source.values():
+            for position, i in enumerate(chunks):
+                self._position[i] = position
+
+        self.vectors = _normalise(np.asarray(embeddings, dtype=np.float32)) if count else np.zeros((0, 1))
+        self.k = min(count, MAX_CLUSTERS, max(MIN_CLUSTERS, int(round(np.sqrt(count))))) if count else 0
+        if self.k:
+            self.labels, self.centroids = kmeans(self.vectors, self.k)
+            self._centrality = np.einsum("ij,ij->i", self.vectors, self.centroids[self.labels])
+        else:
+            self.labels, self.centroids, self._centrality = np.zeros(0, dtype=int), np.zeros((0, 1)), np.zeros(0)
+        self._clear_coverage()
+
+    def _clear_coverage(self):
+        self._used = set()
+        self._blocked = set()  # used chunks and their neighbours
+        self._cluster_uses = [0] * self.k
+        self._source_uses = {source: 0 for source in self._by_source}
+
+    def _order_key(self, i):
+        metadata = self.metadatas[i]
+        return metadata.get("chunk_index", metadata.get("start_index", 0))
+
+    @classmethod
+    def from_store(cls, db, files=None, **kwargs):
+        where = {"source": {"$in": list(files)}} if files else None
+        data = db.get(where=where, include=["documents", "metadatas", "embeddings"])
+        return cls(data["ids"], data["documents"], data["metadatas"], data["embeddings"], **kwargs)
+
+    def _block(self, i):
+        self._used.add(i)
+        chunks = self._by_source[self.sources[i]]
+        position = self._position[i]
+        for neighbour in chunks[max(0, position - 1):position + 2]:
+            self._blocked.add(neighbour)
+
+    def mark_used(self, chunk_ids):
+        # Restores coverage from questions generated earlier (e.g. before a restart)
+        wanted = set(chunk_ids)
+        with self._lock:
+            for i, chunk_id in enumerate(self.ids):
+                if chunk_id in wanted and i not in self._used:
+                    self._block(i)
+                    self._cluster_uses[self.labels[i]] += 1
+                    self._source_uses[self.sources[i]] += 1
+
+    def used_ids(self):
+        with self._lock:
+            return [self.ids[i] for i in self._used]
+
+    def reset(self):
+        # Forgets coverage, e.g. once a long quiz has been through every chunk
+        with self._lock:
+            self._clear_coverage()
+
+    def _context(self, first):
+        # The chosen chunk plus following unused chunks of the same file, with overlapping text removed
+        indices = [first]
+        text = self.documents[first]
+        end = self.metadatas[first].get("start_index", 0) + len(text)
+        chunks = self._by_source[self.sources[first]]
+        for i in chunks[self._position[first] + 1:]:
+            if i in self._blocked or len(text) + len(self.documents[i]) > self.context_chars:
+                break
+            start = self.metadatas[i].get("start_index")
+            overlap = max(0, end - start) if start is not None else 0
+            text += self.documents[i][overlap:] if overlap < len(self.documents[i]) else ""
+            end = (start or 0) + len(self.documents[i])
+            indices.append(i)
+            self._blocked.add(i)
+        for i in indices:
+            self._block(i)
+        return [self.ids[i] for i in indices], text, self.sources[first]
+
+    def next_contexts(self, count, query_vector=None):
+        # Up to count (chunk ids, text, source) contexts, each from a different cluster where possible: least
+        # covered clusters and files first, and within a cluster the chunk closest to its centre (or
+        # to the query, when one is given)
+        if query_vector is not None and self.k:
+            query = np.asarray(query_vector, dtype=np.float32)
+            query = query / (np.linalg.norm(query) or 1.0)
+            cluster_relevance = self.centroids @ query
+            chunk_score = self.vectors @ query
+        else:
+            cluster_relevance = np.zeros(self.k)
+            chunk_score = self._centrality
+
+        contexts = []
+        with self._lock:
+            while len(contexts) < count:
+                picked_this_round = False
+                order = sorted(range(self.k), key=lambda j: (self._cluster_uses[j], -cluster_relevance[j], j))
+                for cluster in order:
+                    if len(contexts) >= count:
+                        break
+                    candidates = [i for i in np.flatnonzero(self.labels == cluster) if i not in self._blocked]
+                    if not candidates:
+                        continue
+                    best = min(candidates, key=lambda i: (self._source_uses[self.sources[i]], -chunk_score[i]))
+                    contexts.append(self._context(best))
+                    self._cluster_uses[cluster] += 1
+                    self._source_uses[self.sources[best]] += 1
+                    picked_this_round = True
+                if not picked_this_round:
+                    break  # every chunk is used or next to a used one
+        return contexts
+
+    def coverage(self):
+        with self._lock:
+            total = len(self.ids)
+            return {
+                "chunks": total,
+                "chunks_used": len(self._used),
+                "fraction_used": round(len(self._used) / total, 3) if total else None,
+                "clusters": self.k,
+                "clusters_covered": len({int(self.labels[i]) for i in self._used}),
+                "sources": len(self._by_source),
+                "sources_covered": len({self.sources[i] for i in self._used}),
+            }
+
+
+def get_sampler(store_path, quiz_id):
+    # The sampler of one quiz over a store: coverage carries across that quiz's calls and no further.
+    # When the store changes the sampler is rebuilt, keeping the chunks the quiz already used.
+    from vector_stores import get_store_version, get_vector_store
+
+    key = (store_path, quiz_id)
+    version = get_store_version(store_path)
+    with _samplers_lock:
+        previous = _samplers.get(key)
+        if previous is not None and previous[0] == version:
+            _samplers.move_to_end(key)
+            return previous[1]
+    sampler = QuizSampler.from_store(get_vector_store(store_path))
+    if previous is not None:
+        sampler.mark_used(previous[1].used_ids())
+    with _samplers_lock:
+        current = _samplers.get(key)
+        if current is not None and current[0] == version:
+            return current[1]  # another call for this quiz built it first
+        _samplers[key] = (version, sampler)
+        _samplers.move_to_end(key)
+        while len(_samplers) > MAX_SAMPLERS:
+            _samplers.popitem(last=False)
+    return sampler
@@ -0,0 +1,218 @@
+from threading import RLock
+
+# Room states
+WAITING = "waiting"
+IN_PROGRESS = "in_progress"
+COMPLETED = "completed"
+
+
+def _index_add(index, key, value):
+    # One-to-many index that stores a lone value as itself and only grows a set for a second one;
+    # most users have one socket and most banks one room, and a set costs ten times a reference
+    current = index.get(key)
+    if current is None:
+        index[key] = value
+    elif isinstance(current, set):
+        current.add(value)
+    elif current != value:
+        index[key] = {current, value}
+
+
+def _index_discard(index, key, value):
+    current = index.get(key)
+    if isinstance(current, set):
+        current.discard(value)
+        if len(current) == 1:
+            index[key] = current.pop()
+    elif current == value:
+        del index[key]
+
+
+def _index_values(index, key):
+    current = index.get(key)
+    if current is None:
+        return ()
+    return tuple(current) if isinstance(current, set) else (current,)
+
+
+class Room:
+    __slots__ = ("code", "host", "quiz_title", "created_at", "files", "status", "bank_id", "members")
+
+    def __init__(self, code, host, quiz_title, created_at, files, bank_id):
+        self.code = code
+        self.host = host
+        self.quiz_title = quiz_title
+        self.created_at = created_at
+        self.files = files
+        self.status = WAITING
+        self.bank_id = bank_id
+        self.members = {}  # username -> number of their sockets in the room; insertion order is join order
+
+    def snapshot(self):
+        # Plain dict handed to handlers, so they never iterate members while another handler changes them
+        return {
+            "room_code": self.code,
+            "host": self.host,
+            "users": list(self.members),
+            "quiz_title": self.quiz_title,
+            "created_at": self.created_at,
+            "files": self.files,
+            "status": self.status,
+            "bank_id": self.bank_id,
+        }
+
+
+class RoomRegistry:
+    # Quiz rooms and the Socket.IO connections in them, indexed every way the handlers look them up:
+    # room code -> room (with username -> socket count membership), sid -> (username, room code),
+    # username -> sids, and bank id -> room codes. A user may have several sockets (tabs) open; they
+    # stay in a room until their last socket there leaves or disconnects. Every update happens under
+    # one lock, so concurrent handlers cannot interleave a join with a leave.
+
+    def __init__(self):
+        self._lock = RLock()
+        self._rooms = {}
+        self._connections = {}  # sid -> (username, room code); both None until the socket joins
+        self._user_sids = {}  # username -> sid, or set of sids
+        self._bank_rooms = {}  # bank id -> room code, or set of room codes
+
+    def connect(self, sid):
+        with self._lock:
+            self._connections[sid] = (None, None)
+
+    def _attach(self, sid, username, code):
+        # Points sid at (username, code), leaving whatever room it was in before; returns that departure
+        previous = self._connections.get(sid, (None, None))
+        if previous == (username, code):
+            return None
+        # Enter the new room before leaving the old one: a socket switching users in a room where its old
+        # user was the only member would otherwise empty and remove the room it is joining
+        room = self._rooms[code]
+        room.members[username] = room.members.get(username, 0) + 1
+        departure = self._detach(sid, *previous) if previous[1] else None
+        if previous[0] and previous[0] != username:
+            _index_discard(self._user_sids, previous[0], sid)
+        self._connections[sid] = (username, code)
+        _index_add(self._user_sids, username, sid)
+        return departure
+
+    def _detach(self, sid, username, code):
+        # Drops one socket from a room; the user leaves it with their last socket there
+        room = self._rooms.get(code)
+        if room is None or username not in room.members:
+            return None
+        room.members[username] -= 1
+        if room.members[username] > 0:
+            return None
+        del room.members[username]
+        return self._departure(room, username)
+
+    def _departure(self, room, username):
+        emptied = not room.members
+        if emptied:
+            self._remove_room(room)
+        return {"room_code": room.code, "username": username, "emptied": emptied}
+
+    def _remove_room(self, room):
+        del self._rooms[room.code]
+        if room.bank_id:
+            _index_discard(self._bank_rooms, room.bank_id, room.code)
+
+    def disconnect(self, sid):
+        # Returns the departure from the socket's room ({room_code, username, emptied}), if any
+        with self._lock:
+            username, code = self._connections.pop(sid, (None, None))
+            if username:
+                _index_discard(self._user_sids, username, sid)
+            return self._detach(sid, username, code) if code else None
+
+    def create_room(self, code, host, sid, quiz_title, created_at, files=(), bank_id=None):
+        # Returns (room snapshot, departure from the sid's previous room), or (None, None) if the code is taken
+        with self._lock:
+            if code in self._rooms:
+                return None, None
+            room = Room(code, host, quiz_title, created_at, list(files), bank_id)
+            self._rooms[code] = room
+            if bank_id:
+                _index_add(self._bank_rooms, bank_id, code)
+            departure = self._attach(sid, host, code)
+            return room.snapshot(), departure
+
+    def join(self, code, username, sid):
+        # Returns (joined, departure from the sid's previous room); joined is False if there is no such room.
+        # Constant time: callers that need the member list ask for it with users() or get()
+        with self._lock:
+            if code not in self._rooms:
+                return False, None
+            return True, self._attach(sid, username, code)
+
+    def leave(self, code, username):
+        # The user leaves the room with all their sockets; returns the departure (with those sids), or None
+        # if they were not in it
+        with self._lock:
+            room = self._rooms.get(code)
+            if room is None or username not in room.members:
+                return None
+            del room.members[username]
+            sids = [
+                sid for sid in _index_values(self._user_sids, username)
+                if self._connections.get(sid) == (username, code)
+            ]
+            for sid in sids:
+                self._connections[sid] = (username, None)
+            return dict(self._departure(room, username), sids=sids)
+
+    def get(self, code):
+        with self._lock:
+            room = self._rooms.get(code)
+            return room.snapshot() if room else None
+
+    def users(self, code):
+        # Members in join order; empty for an unknown room
+        with self._lock:
+            room = self._rooms.get(code)
+            return list(room.members) if room else []
+
+    def connection(self, sid):
+        # (username, room code) of a socket; (None, None) for unknown or idle sockets
+        with self._lock:
+            return self._connections.get(sid, (None, None))
+
+    def sids_of(self, username):
+        with self._lock:
+            return set(_index_values(self._user_sids, username))
+
+    def set_status(self, code, status, only_from=None):
+        # only_from, when given, lists the statuses the room may move from; returns whether it moved
+        with self._lock:
+            room = self._rooms.get(code)
+            if room is None or (only_from is not None and room.status not in only_from):
+                return False
+            room.status = status
+            return True
+
+    def rooms_for_bank(self, bank_id):
+        # Snapshots of the rooms playing from a question bank
+        with self._lock:
+            return [self._rooms[code].snapshot() for code in _index_values(self._bank_rooms, bank_id)]
+
+    def active(self):
+        with self._lock:
+            return {
+                code: {
+                    "quiz_title": room.quiz_title,
+                    "host": room.host,
+                    "user_count": len(room.members),
+                    "status": room.status,
+                }
+                for code, room in self._rooms.items()
+            }
+
+    def stats(self):
+        with self._lock:
+            return {
+                "rooms": len(self._rooms),
+                "connections": len(self._connections),
+                "users_connected": len(self._user_sids),
+                "members": sum(len(room.members) for room in self._rooms.values()),
+            }
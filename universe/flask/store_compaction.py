@@ -0,0 +1,169 @@
+# Rebuilds Chroma stores without the tombstones and duplicates left behind by deleted and re-ingested
+# files, and reports chunk counts, disk size and query latency before and after.
+#
+# Run it while the server is stopped (or restart the server afterwards): other processes keep handles
+# to the old collections.
+#
+#   python universe/flask/store_compaction.py                       # every store under universe/flask
+#   python universe/flask/store_compaction.py universe/flask/chroma --collection owner_alice
+import argparse
+import glob
+import hashlib
+import os
+import sqlite3
+import statistics
+import time
+
+from lexical_index import get_lexical_index
+from vector_stores import invalidate_vector_store
+
+CHROMA_PATH = "universe/flask/chroma"
+COMPACT_BATCH_SIZE = 500
+LATENCY_SAMPLES = 20
+LATENCY_K = 6
+
+
+def _dir_bytes(path):
+    total = 0
+    for root, _dirs, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def _collection_names(client):
+    # chromadb returns Collection objects before 0.6 and bare names from 0.6 on
+    return [c if isinstance(c, str) else c.name for c in client.list_collections()]
+
+
+def _query_latency_ms(collection):
+    sample = collection.get(limit=LATENCY_SAMPLES, include=["embeddings"])["embeddings"]
+    if sample is None or not len(sample):
+        return None
+    timings = []
+    for vector in sample:
+        start = time.perf_counter()
+        collection.query(query_embeddings=[list(vector)], n_results=LATENCY_K, include=[])
+        timings.append(time.perf_counter() - start)
+    return round(statistics.median(timings) * 1000, 2)
+
+
+def _duplicate_key(document, metadata):
+    # Chunks written before ids were stable can appear several times for the same file position
+    metadata = metadata or {}
+    digest = hashlib.sha1((document or "").encode("utf-8")).hexdigest()
+    return (metadata.get("owner"), metadata.get("source"), metadata.get("start_index"), digest)
+
+
+def compact_collection(client, name, batch_size=COMPACT_BATCH_SIZE):
+    temp_name = f"{name[:52]}-compact"
+    existing = _collection_names(client)
+    if temp_name in existing:
+        if name in existing:
+            client.delete_collection(temp_name)  # left by an interrupted run
+        else:
+            client.get_collection(temp_name, embedding_function=None).modify(name=name)
+
+    old = client.get_collection(name, embedding_function=None)
+    report = {"collection": name, "chunks_before": old.count(), "latency_ms_before": _query_latency_ms(old)}
+
+    # Copy every live chunk into a fresh collection, then swap it in under the original name
+    new = client.create_collection(temp_name, metadata=old.metadata, embedding_function=None)
+    seen = set()
+    duplicates = 0
+    offset = 0
+    while True:
+        page = old.get(limit=batch_size, offset=offset, include=["embeddings", "documents", "metadatas"])
+        if not page["ids"]:
+            break
+        offset += len(page["ids"])
+        keep = []
+        for i, (document, metadata) in enumerate(zip(page["documents"], page["metadatas"])):
+            key = _duplicate_key(document, metadata)
+            if key in seen:
+                duplicates += 1
+                continue
+            seen.add(key)
+            keep.append(i)
+        if keep:
+            new.add(
+                ids=[page["ids"][i] for i in keep],
+                embeddings=[list(page["embeddings"][i]) for i in keep],
+                documents=[page["documents"][i] for i in keep],
+                metadatas=[page["metadatas"][i] for i in keep]
+            )
+    client.delete_collection(name)
+    new.modify(name=name)
+
+    report.update({
+        "chunks_after": new.count(),
+        "duplicates_dropped": duplicates,
+        "latency_ms_after": _query_latency_ms(new),
+    })
+    return report
+
+
+def compact_store(persist_directory, collection_name=None, batch_size=COMPACT_BATCH_SIZE):
+    import chromadb
+
+    bytes_before = _dir_bytes(persist_directory)
+    client = chromadb.PersistentClient(path=persist_directory)
+    names = [collection_name] if collection_name else _collection_names(client)
+    reports = []
+    for name in names:
+        start = time.perf_counter()
+        report = compact_collection(client, name, batch_size)
+        report["seconds"] = round(time.perf_counter() - start, 2)
+        reports.append(report)
+
+        lexical_path = os.path.join(persist_directory, "lexical", f"{name}.sqlite3")
+        if os.path.exists(lexical_path):
+            get_lexical_index(persist_directory, name).vacuum()
+        invalidate_vector_store(persist_directory, name)
+    # Quiz stores are opened without a collection name (the default one)
+    invalidate_vector_store(persist_directory)
+
+    # Deleted rows only leave Chroma's SQLite file once it is vacuumed
+    sqlite_path = os.path.join(persist_directory, "chroma.sqlite3")
+    if os.path.exists(sqlite_path):
+        try:
+            with sqlite3.connect(sqlite_path) as conn:
+                conn.execute("VACUUM")
+        except sqlite3.Error as e:
+            print(f"Could not vacuum {sqlite_path}: {e}")
+
+    return {
+        "store": persist_directory,
+        "bytes_before": bytes_before,
+        "bytes_after": _dir_bytes(persist_directory),
+        "collections": reports,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compact Chroma vector stores")
+    parser.add_argument("stores", nargs="*", help="store directories (default: the AI Teacher store and every quiz store)")
+    parser.add_argument("--collection", help="only compact this collection")
+    parser.add_argument("--batch-size", type=int, default=COMPACT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    stores = args.stores or [CHROMA_PATH] + sorted(glob.glob(CHROMA_PATH + "_*"))
+    for store in stores:
+        if not os.path.isdir(store):
+            print(f"{store}: not found")
+            continue
+        result = compact_store(store, args.collection, args.batch_size)
+        print(f"{store}: {result['bytes_before'] / 1e6:.1f} MB -> {result['bytes_after'] / 1e6:.1f} MB")
+        for report in result["collections"]:
+            print(
+                f"  {report['collection']}: {report['chunks_before']} -> {report['chunks_after']} chunks "
+                f"({report['duplicates_dropped']} duplicates dropped), "
+                f"query {report['latency_ms_before']} -> {report['latency_ms_after']} ms, {report['seconds']}s"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import os
+from bisect import bisect_right
+
+from langchain.schema import Document
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+CHUNK_SIZE = 300
+CHUNK_OVERLAP = 100
+# Text is split whenever this much has accumulated, so a 600-page book is never split (or held as chunks) in one go
+FLUSH_CHARS = 16 * CHUNK_SIZE
+# Chunks are embedded and written to the vector store this many at a time
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "64"))
+
+
+def iter_chunks(pages, metadata, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP):
+    # Yields chunk Documents from (page_number, text) pages as they arrive. Chunks may span a page
+    # boundary and overlap carries across it; each chunk records the page it starts on, its position
+    # (chunk_index) and its start_index in the whole document, as if it had been split in one piece.
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        length_function=len
+    )
+    buffer = ""
+    base = 0  # document offset of buffer[0]
+    page_offsets = []  # document offset where each page starts, ascending
+    page_numbers = []
+    count = 0
+
+    def flush(final):
+        nonlocal buffer, base, count
+        cursor = 0
+        keep_from = len(buffer)
+        for piece in splitter.split_text(buffer):
+            offset = buffer.find(piece, cursor)
+            if offset < 0:
+                offset = cursor
+            # The last chunks may still grow once the next page arrives; hold them back
+            if not final and offset + len(piece) > len(buffer) - chunk_size:
+                keep_from = offset
+                break
+            chunk_metadata = dict(metadata, start_index=base + offset, chunk_index=count)
+            page = page_numbers[bisect_right(page_offsets, base + offset) - 1] if page_numbers else None
+            if page is not None:
+                chunk_metadata["page"] = page
+            yield Document(page_content=piece, metadata=chunk_metadata)
+            count += 1
+            cursor = offset + 1
+
+        # Restarting at the first held-back chunk keeps its overlap with the last one emitted
+        buffer = buffer[keep_from:]
+        base += keep_from
+        while len(page_offsets) > 1 and page_offsets[1] <= base:
+            del page_offsets[0], page_numbers[0]
+
+    for page_number, text in pages:
+        if buffer:
+            buffer += "\n"
+        page_offsets.append(base + len(buffer))
+        page_numbers.append(page_number)
+        for i in range(0, len(text), FLUSH_CHARS):
+            buffer += text[i:i + FLUSH_CHARS]
+            if len(buffer) >= FLUSH_CHARS:
+                yield from flush(final=False)
+    yield from flush(final=True)
+
+
+def batched(iterable, size=INGEST_BATCH_SIZE):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
@@ -0,0 +1,135 @@
+import hashlib
+import re
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from embeddings import get_embeddings
+
+# Upper bound on Chroma handles kept open by one worker
+MAX_OPEN_STORES = 64
+# Handles unused for this many seconds are closed on the next access
+IDLE_TIMEOUT_SECONDS = 15 * 60
+
+_stores = OrderedDict()  # (persist_directory, collection_name) -> {"db": Chroma, "last_used": float}
+_versions = {}  # (persist_directory, collection_name) -> int, bumped whenever new chunks are written
+_lock = Lock()
+
+_stats = {
+    "hits": 0,
+    "misses": 0,
+    "evictions": 0,
+    "expirations": 0,
+    "invalidations": 0,
+}
+
+
+def _open_store(persist_directory, collection_name):
+    from langchain_chroma import Chroma
+
+    if collection_name is None:
+        return Chroma(persist_directory=persist_directory, embedding_function=get_embeddings())
+    return Chroma(
+        collection_name=collection_name,
+        persist_directory=persist_directory,
+        embedding_function=get_embeddings()
+    )
+
+
+def _collection_name(prefix, value):
+    # Chroma names must be 3-63 chars of [a-zA-Z0-9._-]; hash anything that does not fit
+    name = f"{prefix}_{value}"
+    if re.fullmatch(r"[a-zA-Z0-9][a-zA-Z0-9._-]{1,61}[a-zA-Z0-9]", name) and ".." not in name:
+        return name
+    return f"{prefix}_{hashlib.sha1(str(value).encode('utf-8')).hexdigest()}"
+
+
+# Each user's AI Teacher chunks live in their own collection so search cost tracks their corpus
+def owner_collection_name(owner):
+    return _collection_name("owner", owner)
+
+
+# Course corpora are shared collections any student can opt into at query time
+def course_collection_name(course):
+    return _collection_name("course", course)
+
+
+# Chunk ids are stable per (owner, file, position), so re-ingesting a file overwrites rather than duplicates
+def chunk_id(owner, source, index):
+    return hashlib.sha1(f"{owner}\x00{source}\x00{index}".encode("utf-8")).hexdigest()
+
+
+def store_is_empty(db):
+    return not db.get(limit=1)["ids"]
+
+
+def delete_source_chunks(db, source, owner=None):
+    # Drops every chunk of one uploaded file (optionally only one owner's copy in a shared collection)
+    where = {"source": source} if owner is None else {"$and": [{"source": source}, {"owner": owner}]}
+    ids = db.get(where=where, include=[])["ids"]
+    if ids:
+        db.delete(ids=ids)
+    return len(ids)
+
+
+def _expire_idle(now):
+    # The OrderedDict is in LRU order, so idle handles are always at the front
+    while _stores:
+        _key, entry = next(iter(_stores.items()))
+        if now - entry["last_used"] < IDLE_TIMEOUT_SECONDS:
+            break
+        _stores.popitem(last=False)
+        _stats["expirations"] += 1
+
+
+def get_vector_store(persist_directory, collection_name=None):
+    key = (persist_directory, collection_name)
+    now = time.monotonic()
+    with _lock:
+        _expire_idle(now)
+        entry = _stores.get(key)
+        if entry is not None:
+            entry["last_used"] = now
+            _stores.move_to_end(key)
+            _stats["hits"] += 1
+            return entry["db"]
+        _stats["misses"] += 1
+
+    # Open outside the lock so a slow open does not block other users' lookups
+    db = _open_store(persist_directory, collection_name)
+
+    with _lock:
+        entry = _stores.get(key)
+        if entry is not None:
+            # Another thread opened it first; keep theirs
+            entry["last_used"] = now
+            _stores.move_to_end(key)
+            return entry["db"]
+        _stores[key] = {"db": db, "last_used": now}
+        while len(_stores) > MAX_OPEN_STORES:
+            _stores.popitem(last=False)
+            _stats["evictions"] += 1
+    return db
+
+
+def invalidate_vector_store(persist_directory, collection_name=None):
+    # Called after ingestion writes so readers reopen the store and cached answers go stale
+    key = (persist_directory, collection_name)
+    with _lock:
+        if _stores.pop(key, None) is not None:
+            _stats["invalidations"] += 1
+        _versions[key] = _versions.get(key, 0) + 1
+
+
+def get_store_version(persist_directory, collection_name=None):
+    with _lock:
+        return _versions.get((persist_directory, collection_name), 0)
+
+
+def vector_store_stats():
+    with _lock:
+        stats = dict(_stats)
+        stats["open"] = len(_stores)
+    stats["max_open"] = MAX_OPEN_STORES
+    stats["idle_timeout_seconds"] = IDLE_TIMEOUT_SECONDS
+    return stats
@@ -5,13 +5,16 @@ import { useNavigate } from 'react-router-dom';
 
 const QuizGame = () => {
   const [socket, setSocket] = useState(null);
-  const [currentQuestionIndex, setCurrentQuestionIndex] = useState(0);
+  // The server runs the game: it opens each question (round_started), closes it (round_ended)
+  // and sends leaderboard changes per round; the browser only displays and submits
+  const [currentQuestion, setCurrentQuestion] = useState(null);
   const [selectedOption, setSelectedOption] = useState(null);
-  const [responses, setResponses] = useState([]);
-  const [showResults, setShowResults] = useState(false);
-  const [score, setScore] = useState(0);
-  const [timer, setTimer] = useState(10);
-  const [usersAnswered, setUsersAnswered] = useState([]);
+  const [reveal, setReveal] = useState(null);
+  const [endsAt, setEndsAt] = useState(0);
+  const [timer, setTimer] = useState(0);
+  const [answeredCount, setAnsweredCount] = useState(0);
+  const [scores, setScores] = useState({});
+  const [topPlayers, setTopPlayers] = useState([]);
   const [usersInRoom, setUsersInRoom] = useState([]);
   const [gameOver, setGameOver] = useState(false);
   const [darkMode, setDarkMode] = useState(
@@ -19,28 +22,18 @@ const QuizGame = () => {
   );
   const roomCode = '0000'; // example room code
   localStorage.setItem('roomCode', roomCode);
+  const username = localStorage.getItem("username");
   const navigate = useNavigate();
 
-  // State to hold fetched questions
-  const [questions, setQuestions] = useState([]);
-
-  // Fetch questions from the backend
-  const fetchQuestions = async () => {
-    try {
-      const response = await fetch('http://127.0.0.1:5000/api/questions'); // Update with your actual endpoint
-      if (!response.ok) {
-        throw new Error('Network response was not ok');
-      }
-      const data = await response.json();
-      setQuestions(data); // Assuming data is an array of question objects
-    } catch (error) {
-      console.error("Error fetching questions:", error);
-    }
+  const showQuestion = (data) => {
+    setCurrentQuestion(data);
+    setEndsAt(data.endsAt);
+    setSelectedOption(null);
+    setReveal(null);
+    setAnsweredCount(0);
   };
 
   useEffect(() => {
-    fetchQuestions(); // Fetch questions when the component mounts
-
     const newSocket = io("http://127.0.0.1:5000");
     setSocket(newSocket);
 
@@ -57,44 +50,84 @@ const QuizGame = () => {
       })
       .catch((error) => console.error("Error fetching room info:", error));
 
-    newSocket.emit("join_room", { roomCode });
+    newSocket.emit("join_room", { roomCode, username });
 
     newSocket.on("user_joined", (data) => {
-      setUsersInRoom((prev) => [...prev, data.username]);
+      setUsersInRoom(data.users);
     });
 
     newSocket.on("user_left", (data) => {
       setUsersInRoom((prev) => prev.filter((user) => user !== data.username));
     });
 
-    newSocket.on("user_response", (data) => {
-      setResponses((prev) => [...prev, data]);
-      setUsersAnswered((prev) => [...prev, data.username]);
+    // Joining a game already in progress
+    newSocket.on("game_state", (data) => {
+      setTopPlayers(data.leaderboard);
+      setScores(Object.fromEntries(data.leaderboard.map((entry) => [entry.username, entry.score])));
+      if (data.you) {
+        setScores((prev) => ({ ...prev, [username]: data.you.score }));
+      }
+      if (data.state === "question") {
+        showQuestion(data);
+      }
+      setGameOver(data.state === "finished");
+    });
+
+    newSocket.on("round_started", showQuestion);
+
+    newSocket.on("round_progress", (data) => {
+      setAnsweredCount(data.answered);
+    });
+
+    newSocket.on("answer_received", (data) => {
+      if (!data.accepted) {
+        console.warn("Answer not accepted:", data.reason);
+      }
+    });
+
+    newSocket.on("round_ended", (data) => {
+      setReveal(data);
+      setEndsAt(0);
     });
 
-    newSocket.on("next_question", () => {
-      resetQuestionState();
+    newSocket.on("leaderboard_delta", (data) => {
+      setScores((prev) => ({ ...prev, ...data.changes }));
+      setTopPlayers(data.top);
+    });
+
+    newSocket.on("game_over", (data) => {
+      setTopPlayers(data.leaderboard.slice(0, 10));
+      setScores(Object.fromEntries(data.leaderboard.map((entry) => [entry.username, entry.score])));
+      setGameOver(true);
     });
 
     return () => newSocket.close();
   }, [roomCode]);
 
+  // Countdown display only; the server decides when the question closes
   useEffect(() => {
-    if (timer > 0 && !showResults) {
-      const interval = setInterval(() => setTimer((prev) => prev - 1), 1000);
-      return () => clearInterval(interval);
-    } else if (timer === 0 && !showResults) {
-      handleEndQuestion();
+    if (!endsAt) {
+      setTimer(0);
+      return;
     }
-  }, [timer, showResults]);
+    const tick = () => setTimer(Math.max(0, Math.ceil((endsAt - Date.now()) / 1000)));
+    tick();
+    const interval = setInterval(tick, 250);
+    return () => clearInterval(interval);
+  }, [endsAt]);
 
-  const handleOptionClick = (option) => {
+  const handleOptionClick = (option, index) => {
+    if (selectedOption !== null || reveal) {
+      return;
+    }
     setSelectedOption(option);
     if (socket) {
       socket.emit("submit_response", {
-        username: localStorage.getItem("username"),
+        roomCode,
+        username,
         answer: option,
-        questionIndex: currentQuestionIndex,
+        answerIndex: index,
+        questionIndex: currentQuestion.questionIndex,
       });
     }
   };
@@ -107,42 +140,8 @@ const QuizGame = () => {
     navigate('/education');
   };
 
-  const handleEndQuestion = () => {
-    setShowResults(true);
-
-    // Ensure we have valid questions and responses
-    if (questions.length > currentQuestionIndex) {
-      const currentQuestion = questions[currentQuestionIndex];
-
-      // Check for correct responses
-      const correctResponses = responses.filter(
-        (response) => response.answer === currentQuestion.answer
-      );
-
-      // Update score based on selected option
-      if (selectedOption && selectedOption === currentQuestion.answer) {
-        setScore((prev) => prev + 1);
-      }
-
-      // Move to next question or end game
-      setTimeout(() => {
-        if (currentQuestionIndex < questions.length - 1) {
-          setCurrentQuestionIndex((prev) => prev + 1);
-          resetQuestionState();
-        } else {
-          setGameOver(true);
-        }
-      }, 5000);
-    }
-  };
-
-  // Reset question state for next question
-  const resetQuestionState = () => {
-    setShowResults(false);
-    setSelectedOption(null);
-    setResponses([]);
-    setTimer(10);
-  };
+  const showResults = reveal !== null;
+  const score = scores[username] || 0;
 
   return (
     <div style={{
@@ -184,7 +183,12 @@ const QuizGame = () => {
           <div className="flex flex-col items-center justify-center">
             <div className="text-center mb-8">
               <h2 className="text-4xl font-bold mb-4">Game Over!</h2>
-              <p className="text-2xl font-semibold mb-8">Your score: {score} / {questions.length}</p>
+              <p className="text-2xl font-semibold mb-8">Your score: {score}</p>
+              <ol className="text-lg">
+                {topPlayers.map((entry) => (
+                  <li key={entry.username}>{entry.rank}. {entry.username} ({entry.score})</li>
+                ))}
+              </ol>
             </div>
             
             <div className="flex gap-4">
@@ -208,26 +212,26 @@ const QuizGame = () => {
             </div>
           </div>
         ) : (
-          questions.length > currentQuestionIndex && (
+          currentQuestion && (
             <div>
-              <h2 style={{ fontSize: "2.5rem" }}>{questions[currentQuestionIndex].question}</h2>
+              <h2 style={{ fontSize: "2.5rem" }}>{currentQuestion.question}</h2>
               <div style={{ marginTop: "30px" }}>
-                {questions[currentQuestionIndex].options.map((option, index) => (
+                {currentQuestion.options.map((option, index) => (
                   <button
                     key={index}
-                    onClick={() => handleOptionClick(option)}
+                    onClick={() => handleOptionClick(option, index)}
                     disabled={showResults}
                     style={{
                       margin: "10px",
                       padding: "15px",
                       backgroundColor:
-                        showResults && option === questions[currentQuestionIndex].answer
+                        showResults && index === reveal.answerIndex
                           ? "#28a745"
                           : selectedOption === option
                           ? "#007BFF"
                           : "#f0f0f0",
                       color:
-                        showResults && option === questions[currentQuestionIndex].answer
+                        showResults && index === reveal.answerIndex
                           ? "#fff"
                           : selectedOption === option
                           ? "#fff"
@@ -244,7 +248,12 @@ const QuizGame = () => {
                   </button>
                 ))}
               </div>
-              <h3 style={{ marginTop: "20px", fontSize: "1.5rem" }}>Time Left: {timer} seconds</h3>
+              <h3 style={{ marginTop: "20px", fontSize: "1.5rem" }}>
+                {showResults
+                  ? `${reveal.correct} of ${reveal.players} answered correctly`
+                  : `Time Left: ${timer} seconds (${answeredCount} of ${usersInRoom.length} answered)`}
+              </h3>
+              <p style={{ marginTop: "10px", fontSize: "1.2rem" }}>Your score: {score}</p>
             </div>
           )
         )}
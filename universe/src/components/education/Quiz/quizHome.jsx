@@ -8,6 +8,7 @@ const QuizRoom = () => {
   const [roomCode, setRoomCode] = useState("");
   const [quizTitle, setQuizTitle] = useState("");
   const [files, setUploadedFiles] = useState([]);
+  const [bankId, setBankId] = useState(null);
   const [darkMode, setDarkMode] = useState(
     localStorage.getItem("theme") === "dark" || false
   );
@@ -134,6 +135,8 @@ const QuizRoom = () => {
         }
         const data = await response.json();
         console.log("Server Response:", data);
+        // The question bank built from this upload; the room created next plays from it
+        setBankId(data.bank_id);
         alert("Files uploaded successfully!");
         setFiles([]);
     } catch (error) {
@@ -194,7 +197,8 @@ const QuizRoom = () => {
       roomCode: newRoomCode,
       quizTitle,
       creator: userInput,
-      files: files.map(f => f.name)
+      files: files.map(f => f.name),
+      bankId
     });
   
     // Set room code in local state
@@ -222,7 +226,7 @@ const QuizRoom = () => {
       alert(errorData.message || "An error occurred while creating the room.");
     });
   
-  }, [socket, connected, quizTitle, files]);
+  }, [socket, connected, quizTitle, files, bankId]);
   
 
   const handleLeaveRoom = useCallback(() => {